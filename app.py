@@ -1,22 +1,71 @@
 from flask import Flask
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
 from database import db
 from celery_app import create_celery_app
 from celery_config import beat_schedule, task_routes, task_time_limit, task_soft_time_limit
 from routes import api_bp
-from models import User, Subject, Chapter, Quiz, Question, Choice, Score, Answer, UserAnswer
+import cache
+from serializers import JSONRequest
+from jwt_cache import CachingJWTManager
+import sqltime
+from models import User, Subject, Chapter, Quiz, Question, Choice, Score, Answer
+from logging.handlers import QueueHandler, QueueListener
+import atexit
 import logging
-import redis
 import os
+import queue
+
+
+_log_queue = None
+_log_handlers = ()
+_log_listener_pid = None
+
+
+def start_log_listener():
+    """Start the thread draining the log queue in this process, once.
+
+    Threads do not survive fork(), so when gunicorn preloads the app each
+    worker calls this again from post_fork to get its own listener.
+    """
+    global _log_listener_pid
+    if _log_queue is None or _log_listener_pid == os.getpid():
+        return
+    
+    listener = QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    _log_listener_pid = os.getpid()
+
+
+def configure_logging(app):
+    """Hand log records to a background thread so handlers never block a request"""
+    global _log_queue, _log_handlers
+    level = logging.DEBUG if app.config['DEBUG'] else logging.INFO
+    logging.basicConfig(level=level)
+    logging.getLogger('werkzeug').setLevel(level)
+    
+    root = logging.getLogger()
+    handlers = [h for h in root.handlers if not isinstance(h, QueueHandler)]
+    if not handlers:
+        return
+    
+    _log_queue = queue.SimpleQueue()
+    _log_handlers = handlers
+    root.handlers = [QueueHandler(_log_queue)]
+    start_log_listener()
 
 
 def create_app(config_class=Config):
     app = Flask(__name__)
+    app.request_class = JSONRequest
     app.config.from_object(config_class)
     
+    if app.config['TRUSTED_PROXY_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+    
     CORS(app, 
          resources={r"/*": {
              "origins": "*",
@@ -25,8 +74,9 @@ def create_app(config_class=Config):
          }},
          supports_credentials=True)
     
-    jwt = JWTManager(app)
+    jwt = CachingJWTManager(app)
     db.init_app(app)
+    sqltime.init_app(app)
     migrate = Migrate(app, db)
     celery = create_celery_app(app)
     
@@ -37,19 +87,12 @@ def create_app(config_class=Config):
         task_soft_time_limit=task_soft_time_limit
     )
     
-    logging.basicConfig(level=logging.DEBUG)
-    logger = logging.getLogger(__name__)
-    
-    werkzeug_logger = logging.getLogger('werkzeug')
-    werkzeug_logger.setLevel(logging.DEBUG)
+    configure_logging(app)
     
-    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-    try:
-        redis_client = redis.from_url(redis_url)
-        redis_client.ping()
-        logger.info("Successfully connected to Redis")
-    except redis.exceptions.ConnectionError:
-        logger.warning("Failed to connect to Redis. Caching will be disabled.")
+    # The pooled client connects lazily; cache helpers back off on their own
+    # when Redis is unreachable, so there is nothing to ping at startup.
+    app.extensions['redis'] = cache.redis_client
+    cache.init_app(app)
     
     app.register_blueprint(api_bp, url_prefix='/api')
 
@@ -58,4 +101,4 @@ def create_app(config_class=Config):
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='127.0.0.1', port=5000) 
\ No newline at end of file
+    app.run(debug=app.config['DEBUG'], threaded=app.config['THREADED'], host='127.0.0.1', port=5000) 
\ No newline at end of file
@@ -0,0 +1,431 @@
+from flask import current_app, g, has_app_context, has_request_context
+from functools import wraps
+import hashlib
+import logging
+import orjson
+import os
+import pickle
+import redis
+import time
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = 300
+CATALOG_TIMEOUT = 3600
+AVAILABILITY_TIMEOUT = 60
+USER_TIMEOUT = 30
+LAST_LOGIN_BUFFER = 'last_login_buffer'
+REDIS_RETRY_AFTER = 30
+REBUILD_LOCK_MS = 5000
+REBUILD_WAIT = 0.05
+REBUILD_WAIT_TRIES = 10
+REPORT_TIMEOUT = 900
+REPORT_REFRESH_LOCK_MS = 120000
+# Must outlive every cache TTL, so a version cannot lapse back to a value a
+# pending write still holds
+VERSION_TIMEOUT = 86400
+
+redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+redis_pool = redis.ConnectionPool.from_url(
+    redis_url,
+    max_connections=50,
+    socket_keepalive=True,
+    socket_connect_timeout=1,
+    socket_timeout=1,
+    health_check_interval=30,
+    client_name='quiz-master'
+)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+_redis_down_until = 0
+
+
+def get_redis():
+    """Return the shared Redis client, or None while Redis is unreachable"""
+    if time.monotonic() < _redis_down_until:
+        return None
+    if has_app_context():
+        return current_app.extensions.get('redis', redis_client)
+    return redis_client
+
+
+def mark_redis_down(error):
+    """Skip Redis for a while after a connection error instead of failing every call"""
+    global _redis_down_until
+    logger.warning("Cache error: %s", error)
+    _redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+
+def _digest(params):
+    payload = orjson.dumps(params, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def make_cache_key(name, params, variant=''):
+    """Build a short cache key that is independent of keyword argument order"""
+    return f'cache:{name}:{_digest(params)}:{variant}'
+
+
+def make_keyset(name, params):
+    """Name of the set tracking every cached variant of name for the given arguments"""
+    return f'keyset:{name}:{_digest(params)}'
+
+
+def version_key(keyset):
+    """Counter advanced each time keyset is invalidated; see write_cache"""
+    return f'version:{keyset}'
+
+
+def get_or_set(key, ttl, loader, keyset=None, defer=False, lock=False):
+    """Return the cached value for key, calling loader and caching its result on a miss.
+
+    When keyset is given the key is also recorded there so safe_delete_cache
+    can drop it without scanning the keyspace. With defer the write is
+    made after the response has been sent instead of before it. With lock
+    only one caller rebuilds an expired key; the others wait briefly for
+    its result instead of all running loader at once.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return loader()
+
+    lock_key = f'lock:{key}' if lock else None
+    version = None
+    try:
+        if keyset:
+            cached, version = redis_client.mget([key, version_key(keyset)])
+        else:
+            cached = redis_client.get(key)
+        if cached is None and lock_key and not redis_client.set(lock_key, 1, nx=True, px=REBUILD_LOCK_MS):
+            for _ in range(REBUILD_WAIT_TRIES):
+                time.sleep(REBUILD_WAIT)
+                cached = redis_client.get(key)
+                if cached is not None:
+                    break
+            lock_key = None
+        if cached is not None:
+            return pickle.loads(cached)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return loader()
+
+    try:
+        value = loader()
+    except Exception:
+        release_lock(lock_key)
+        raise
+    if value is None:
+        release_lock(lock_key)
+        return value
+
+    write = (key, ttl, pickle.dumps(value), keyset, lock_key, version)
+    if defer and has_request_context():
+        g.setdefault('cache_writes', []).append(write)
+    else:
+        write_cache([write])
+    return value
+
+
+def write_cache(writes):
+    """Store (key, ttl, payload, keyset, lock_key, version) entries in one transaction.
+
+    version is the keyset's version read before the value was loaded. If
+    the keyset has been invalidated since, the value may predate the change
+    and the entry is dropped instead of stored.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    version_keys = list({version_key(keyset) for _, _, _, keyset, _, _ in writes if keyset})
+    try:
+        with redis_client.pipeline() as pipe:
+            current = {}
+            if version_keys:
+                pipe.watch(*version_keys)
+                current = dict(zip(version_keys, pipe.mget(version_keys)))
+            pipe.multi()
+            for key, ttl, payload, keyset, lock_key, version in writes:
+                if lock_key:
+                    pipe.delete(lock_key)
+                if keyset and current[version_key(keyset)] != version:
+                    continue
+                pipe.setex(key, ttl, payload)
+                if keyset:
+                    pipe.sadd(keyset, key)
+                    pipe.expire(keyset, ttl)
+            pipe.execute()
+    except redis.WatchError:
+        # An invalidation landed while writing; drop everything but the locks
+        for _, _, _, _, lock_key, _ in writes:
+            release_lock(lock_key)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def release_lock(lock_key):
+    """Drop a rebuild lock taken by get_or_set without storing a value"""
+    redis_client = get_redis()
+    if lock_key is None or redis_client is None:
+        return
+
+    try:
+        redis_client.delete(lock_key)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def cache_response(timeout=CACHE_TIMEOUT, vary=None):
+    """Cache the JSON body of successful responses.
+
+    vary is an optional callable returning a string that is appended to the
+    key, for views whose output depends on who is asking.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            cache_key = make_cache_key(f.__name__, kwargs, vary() if vary else '')
+            keyset = make_keyset(f.__name__, kwargs)
+            uncached = []
+
+            def load():
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    uncached.append(response)
+                    return None
+                return response.get_data()
+
+            body = get_or_set(cache_key, timeout, load, keyset, defer=True, lock=True)
+            if uncached:
+                return uncached[0]
+            return current_app.response_class(body, mimetype='application/json')
+
+        return decorated_function
+    return decorator
+
+
+def safe_delete_cache(name, **params):
+    """Safely delete every cached variant of a view for the given arguments.
+
+    Inside a request the deletion is queued and run once the response has
+    been sent; see init_app.
+    """
+    keyset = make_keyset(name, params)
+    if has_request_context():
+        g.setdefault('cache_invalidations', set()).add(keyset)
+        return
+    bump_versions([keyset])
+    delete_keysets([keyset])
+
+
+def bump_versions(keysets):
+    """Advance the version of each keyset so pending writes of older values are dropped"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for keyset in keysets:
+            pipe.incr(version_key(keyset))
+            pipe.expire(version_key(keyset), VERSION_TIMEOUT)
+        pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def delete_keysets(keysets):
+    """Delete every key recorded in keysets, and the sets themselves, in two round trips"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    keysets = list(keysets)
+    try:
+        pipe = redis_client.pipeline()
+        for keyset in keysets:
+            pipe.smembers(keyset)
+        keys = set().union(*pipe.execute())
+        redis_client.delete(*keys, *keysets)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def init_app(app):
+    """Run cache writes and invalidations queued during a request after its response is sent.
+
+    Invalidated keysets have their versions bumped before the response goes
+    out, so a reader that loaded the old data and writes it back later is
+    turned away by write_cache.
+    """
+    @app.after_request
+    def flush_cache(response):
+        writes = g.pop('cache_writes', None)
+        keysets = g.pop('cache_invalidations', None)
+        if keysets:
+            bump_versions(keysets)
+        if writes:
+            response.call_on_close(lambda: write_cache(writes))
+        if keysets:
+            response.call_on_close(lambda: delete_keysets(keysets))
+        return response
+
+
+def generation(*names):
+    """Current values of the named generation counters, joined for use as a cache key variant"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return ''
+
+    try:
+        values = redis_client.mget([f'gen:{name}' for name in names])
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return ''
+    return ':'.join((value or b'0').decode() for value in values)
+
+
+def bump_generation(*names):
+    """Advance the named generation counters, orphaning every key built from them.
+
+    The orphaned entries are never read again and lapse with their TTL.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for name in names:
+            pipe.incr(f'gen:{name}')
+        pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def load_report(period):
+    """Return the prebuilt report body for period, or None if it is missing or Redis is down"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return None
+
+    try:
+        return redis_client.hget(f'report:{period}', 'body')
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return None
+
+
+def report_stamp(period):
+    """Stamp stored with the report for period by store_report, or None"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return None
+
+    try:
+        stamp = redis_client.hget(f'report:{period}', 'stamp')
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return None
+    return stamp.decode() if stamp else None
+
+
+def store_report(period, body, stamp):
+    """Save a prebuilt report body together with the stamp it was built for"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(f'report:{period}', mapping={'body': body, 'stamp': stamp})
+        pipe.expire(f'report:{period}', REPORT_TIMEOUT)
+        pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def touch_report(period):
+    """Keep an up-to-date report for period from expiring between rebuilds"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    try:
+        redis_client.expire(f'report:{period}', REPORT_TIMEOUT)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def claim_report_refresh(period):
+    """Mark a rebuild of period as queued; False if one is already pending.
+
+    The claim lapses after REPORT_REFRESH_LOCK_MS in case the task never runs.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return True
+
+    try:
+        return bool(redis_client.set(f'report-refresh:{period}', 1, nx=True, px=REPORT_REFRESH_LOCK_MS))
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return True
+
+
+def release_report_refresh(period):
+    """Drop the claim taken by claim_report_refresh once period has been rebuilt"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    try:
+        redis_client.delete(f'report-refresh:{period}')
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def over_rate_limit(key, limit, window):
+    """Count a hit against key and report whether it exceeded limit within window seconds"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return False
+
+    try:
+        pipe = redis_client.pipeline()
+        pipe.set(key, 0, ex=window, nx=True)
+        pipe.incr(key)
+        _, hits = pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return False
+    return hits > limit
+
+
+def rate_limit_hits(key):
+    """Hits counted against key by over_rate_limit in its current window, 0 if unknown"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return 0
+
+    try:
+        hits = redis_client.get(key)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return 0
+    return int(hits or 0)
+
+
+def buffer_last_login(user_id, when):
+    """Queue a login time for flush_last_logins; returns False if Redis is unavailable"""
+    redis_client = get_redis()
+    if redis_client is None:
+        return False
+
+    try:
+        redis_client.hset(LAST_LOGIN_BUFFER, user_id, when.isoformat())
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return False
+    return True
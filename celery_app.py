@@ -15,6 +15,7 @@ def create_celery_app(app=None):
         backend=app.config['CELERY_RESULT_BACKEND']
     )
     
+    celery.config_from_object('celery_config')
     celery.conf.update(app.config)
     
     class ContextTask(celery.Task):
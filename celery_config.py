@@ -1,12 +1,13 @@
 from celery.schedules import crontab
 import os
+import serializers  # registers the 'orjson' kombu serializer
 
 broker_url = 'redis://localhost:6379/0'
 result_backend = 'redis://localhost:6379/0'
 
-task_serializer = 'json'
-result_serializer = 'json'
-accept_content = ['json']
+task_serializer = 'orjson'
+result_serializer = 'orjson'
+accept_content = ['orjson', 'json']
 timezone = 'UTC'
 enable_utc = True
 
@@ -16,7 +17,10 @@ task_soft_time_limit = 3000
 task_routes = {
     'tasks.send_daily_reminders': {'queue': 'reminders'},
     'tasks.generate_monthly_reports': {'queue': 'reports'},
-    'tasks.export_user_quizzes_as_csv': {'queue': 'exports'}
+    'tasks.export_user_quizzes_as_csv': {'queue': 'exports'},
+    'tasks.flush_last_logins': {'queue': 'reminders'},
+    'tasks.refresh_reports': {'queue': 'reports'},
+    'tasks.send_one_email': {'queue': 'reminders'}
 }
 
 task_annotations = {
@@ -33,12 +37,27 @@ beat_schedule = {
     'generate-monthly-reports': {
         'task': 'tasks.generate_monthly_reports',
         'schedule': crontab(0, 0, day_of_month='1')  # Run on the 1st of each month
+    },
+    'flush-last-logins': {
+        'task': 'tasks.flush_last_logins',
+        'schedule': 60.0
+    },
+    'refresh-reports': {
+        'task': 'tasks.refresh_reports',
+        'schedule': 120.0
     }
 }
 
 worker_max_tasks_per_child = 100
 worker_prefetch_multiplier = 1
 
+# Exports and reports run for minutes; acknowledge only once they finish so a
+# lost worker hands the message back instead of dropping it. Tasks must
+# therefore be safe to run twice.
+task_acks_late = True
+task_reject_on_worker_lost = True
+task_acks_on_failure_or_timeout = True
+
 result_expires = 3600  
 task_track_started = True  
 
@@ -0,0 +1,33 @@
+from celery import signals
+from celery.loaders.app import AppLoader
+from celery.worker import state as worker_state
+
+
+class SingleTaskLoader(AppLoader):
+    """Loader for the long-running worker pool.
+
+    Even with a prefetch multiplier of 1 a worker keeps one reserved message
+    per process, and a reserved export cannot be picked up by a worker that
+    is started later. This loader stops the worker from taking a message
+    off the queue while all of its processes are busy.
+
+    Enable it per worker with CELERY_LOADER=celery_loader:SingleTaskLoader.
+    """
+
+    concurrency = 1
+
+    def on_worker_init(self):
+        super().on_worker_init()
+
+        from kombu.transport.virtual import QoS
+
+        loader = self
+
+        @signals.worker_init.connect(weak=False)
+        def record_concurrency(sender=None, **kwargs):
+            loader.concurrency = sender.concurrency or 1
+
+        def can_consume(qos):
+            return len(worker_state.reserved_requests) < loader.concurrency
+
+        QoS.can_consume = can_consume
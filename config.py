@@ -2,18 +2,47 @@ import os
 from datetime import timedelta
 
 
+def engine_options(database_uri):
+    """SQLAlchemy engine options for the given database URI."""
+    options = {'query_cache_size': 1200}
+    if not database_uri or database_uri.startswith('sqlite'):
+        options['connect_args'] = {'check_same_thread': False}
+        return options
+    
+    options.update({
+        'pool_size': 20,
+        'max_overflow': 40,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800
+    })
+    if database_uri.startswith('postgres'):
+        options['connect_args'] = {'application_name': 'quiz-master'}
+    return options
+
+
 class Config:
     """Base configuration class."""
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() in ('true', '1', 't')
     
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///quiz_master.db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    THREADED = True
+    QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'False').lower() in ('true', '1', 't')
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 50))
+    # Argon2 cost settings; the defaults verify in about 50 ms on one core
+    ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+    ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 32768))
+    ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 2))
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', SECRET_KEY)
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=90)
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+    # Number of reverse proxies (gunicorn behind nginx, the Vite dev proxy)
+    # whose X-Forwarded-For entries are trusted for the client address
+    TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
 
 
 
@@ -21,12 +50,14 @@ class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///quiz_master_dev.db'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
 
 
 class TestingConfig(Config):
     """Testing configuration."""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///quiz_master_test.db'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=5)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(seconds=10)
 
@@ -39,6 +70,7 @@ class ProductionConfig(Config):
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     
     REMEMBER_COOKIE_SECURE = True
     REMEMBER_COOKIE_HTTPONLY = True
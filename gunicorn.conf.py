@@ -0,0 +1,19 @@
+import multiprocessing
+import os
+
+# Routes spend most of their time waiting on the database and Redis, so
+# gevent workers serve many requests per process while they wait.
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+worker_class = 'gevent'
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = 1000
+keepalive = 5
+timeout = 60
+preload_app = True
+
+
+def post_fork(server, worker):
+    # The app is loaded in the master, whose log listener thread is not
+    # copied into the worker by fork(); start one for this worker.
+    from app import start_log_listener
+    start_log_listener()
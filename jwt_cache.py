@@ -0,0 +1,43 @@
+from flask_jwt_extended import JWTManager
+import hashlib
+import threading
+import time
+
+
+DECODE_CACHE_TTL = 30
+DECODE_CACHE_SIZE = 10000
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager that remembers successfully verified tokens for a short while.
+
+    Clients send the same access token on every request, so the signature
+    check and claim validation are repeated for identical input. Only
+    successful decodes are cached, and never past the token's own expiry.
+    """
+
+    def __init__(self, app=None):
+        self._decoded = {}
+        self._decoded_lock = threading.Lock()
+        super().__init__(app)
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        key = (hashlib.sha256(encoded_token.encode()).digest(), csrf_value, allow_expired)
+        now = time.time()
+
+        cached = self._decoded.get(key)
+        if cached is not None and cached[1] > now:
+            return dict(cached[0])
+
+        decoded = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        expires = now + DECODE_CACHE_TTL
+        if 'exp' in decoded and not allow_expired:
+            expires = min(expires, decoded['exp'])
+        with self._decoded_lock:
+            if len(self._decoded) >= DECODE_CACHE_SIZE:
+                self._decoded = {k: v for k, v in self._decoded.items() if v[1] > now}
+                if len(self._decoded) >= DECODE_CACHE_SIZE:
+                    self._decoded = {}
+            self._decoded[key] = (decoded, expires)
+        return dict(decoded)
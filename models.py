@@ -1,9 +1,35 @@
 from database import db
+from config import Config
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from flask_jwt_extended import create_access_token
+from sqlalchemy.ext.hybrid import hybrid_property
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerificationError
+import sys
 
 
+password_hasher = PasswordHasher(
+    time_cost=Config.ARGON2_TIME_COST,
+    memory_cost=Config.ARGON2_MEMORY_COST,
+    parallelism=Config.ARGON2_PARALLELISM
+)
+
+
+def off_event_loop(func, *args):
+    """Call func(*args) without stalling the other greenlets of a gevent worker.
+
+    Password hashing takes tens of milliseconds in C and never yields to the
+    gevent hub, so under monkey-patched workers it runs on the hub's native
+    thread pool instead; elsewhere it is called directly.
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is None or not monkey.is_module_patched('threading'):
+        return func(*args)
+    
+    from gevent import get_hub
+    return get_hub().threadpool.apply(func, args)
+
 
 
 class User(db.Model):
@@ -11,23 +37,38 @@ class User(db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(64), unique=True, nullable=False)
+    username = db.Column(db.String(32), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256), nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)
     first_name = db.Column(db.String(64))
     last_name = db.Column(db.String(64))
-    role = db.Column(db.String(20), default='user')  
+    role = db.Column(db.Enum('user', 'admin', name='user_role'), default='user')  
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
     
-    scores = db.relationship('Score', backref='user', lazy='dynamic')
+    scores = db.relationship('Score', backref='user', lazy='select')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = off_event_loop(password_hasher.hash, password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Hashes created before the switch to Argon2 are werkzeug pbkdf2 hashes;
+        # upgrade them in place once the password is known to be correct.
+        if not self.password_hash.startswith('$argon2'):
+            if not off_event_loop(check_password_hash, self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            off_event_loop(password_hasher.verify, self.password_hash, password)
+        except (VerificationError, InvalidHash):
+            return False
+        
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def is_admin(self):
         return self.role == 'admin'
@@ -49,7 +90,7 @@ class Subject(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    chapters = db.relationship('Chapter', backref='subject', lazy='dynamic', cascade='all, delete-orphan')
+    chapters = db.relationship('Chapter', backref='subject', lazy='raise', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Subject {self.name}>'
@@ -59,14 +100,14 @@ class Chapter(db.Model):
     __tablename__ = 'chapters'
     
     id = db.Column(db.Integer, primary_key=True)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    order = db.Column(db.Integer, default=0)
+    order = db.Column(db.SmallInteger, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    quizzes = db.relationship('Quiz', backref='chapter', lazy='dynamic', cascade='all, delete-orphan')
+    quizzes = db.relationship('Quiz', backref='chapter', lazy='raise', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Chapter {self.name}>'
@@ -74,23 +115,33 @@ class Chapter(db.Model):
 class Quiz(db.Model):
     """Quiz model representing a set of questions for a specific chapter."""
     __tablename__ = 'quizzes'
+    __table_args__ = (
+        # Partial index over live quizzes only, used by Quiz.is_available;
+        # databases without partial indexes get a plain (start_date, end_date) one.
+        db.Index(
+            'ix_quiz_live', 'start_date', 'end_date',
+            postgresql_where=db.text('is_active'),
+            sqlite_where=db.text('is_active = 1')
+        ),
+        db.Index('ix_quiz_chapter_active', 'chapter_id', 'is_active'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapters.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    duration_minutes = db.Column(db.Integer, default=30)
-    passing_score = db.Column(db.Integer, default=60)  
+    duration_minutes = db.Column(db.SmallInteger, default=30)
+    passing_score = db.Column(db.SmallInteger, default=60)  
     is_active = db.Column(db.Boolean, default=True)
     start_date = db.Column(db.DateTime)
     end_date = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    questions = db.relationship('Question', backref='quiz', lazy='dynamic', cascade='all, delete-orphan')
-    scores = db.relationship('Score', backref='quiz', lazy='dynamic')
+    questions = db.relationship('Question', backref='quiz', lazy='select', cascade='all, delete-orphan')
+    scores = db.relationship('Score', backref='quiz', lazy='select')
     
-    @property
+    @hybrid_property
     def is_available(self):
         now = datetime.utcnow()
         if not self.is_active:
@@ -101,6 +152,16 @@ class Quiz(db.Model):
             return False
         return True
     
+    @is_available.expression
+    def is_available(cls):
+        # utcnow() is bound as a parameter so SQL and Python agree on the clock
+        now = datetime.utcnow()
+        return db.and_(
+            cls.is_active == True,
+            db.or_(cls.start_date == None, cls.start_date <= now),
+            db.or_(cls.end_date == None, cls.end_date >= now)
+        )
+    
     def __repr__(self):
         return f'<Quiz {self.title}>'
 
@@ -112,28 +173,45 @@ class Question(db.Model):
     __tablename__ = 'questions'
     
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False, index=True)
     text = db.Column(db.Text, nullable=False)
     explanation = db.Column(db.Text)
-    points = db.Column(db.Integer, default=1)
-    order = db.Column(db.Integer, default=0)
+    points = db.Column(db.SmallInteger, default=1)
+    order = db.Column(db.SmallInteger, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    choices = db.relationship('Choice', backref='question', lazy='dynamic', cascade='all, delete-orphan')
+    choices = db.relationship('Choice', backref='question', lazy='select', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Question {self.id}: {self.text[:20]}...>'
 
+
+Quiz.question_count = db.column_property(
+    db.select(db.func.count(Question.id))
+    .where(Question.quiz_id == Quiz.id)
+    .correlate_except(Question)
+    .scalar_subquery(),
+    deferred=True
+)
+
+Chapter.quiz_count = db.column_property(
+    db.select(db.func.count(Quiz.id))
+    .where(Quiz.chapter_id == Chapter.id)
+    .correlate_except(Quiz)
+    .scalar_subquery(),
+    deferred=True
+)
+
 class Choice(db.Model):
     """Choice model representing an answer option for a question."""
     __tablename__ = 'choices'
     
     id = db.Column(db.Integer, primary_key=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False, index=True)
     text = db.Column(db.Text, nullable=False)
     is_correct = db.Column(db.Boolean, default=False)
-    order = db.Column(db.Integer, default=0)
+    order = db.Column(db.SmallInteger, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -145,6 +223,11 @@ class Choice(db.Model):
 class Score(db.Model):
     """Score model recording user's quiz attempt results."""
     __tablename__ = 'scores'
+    __table_args__ = (
+        db.Index('ix_scores_user_completed', 'user_id', 'completed_at'),
+        db.Index('ix_scores_quiz_completed', 'quiz_id', 'completed_at'),
+        db.Index('ix_scores_completed', 'completed_at', 'passed', 'score'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -154,7 +237,7 @@ class Score(db.Model):
     passed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    answers = db.relationship('Answer', backref='score', lazy='dynamic', cascade='all, delete-orphan')
+    answers = db.relationship('Answer', backref='score', lazy='select', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Score: User {self.user_id}, Quiz {self.quiz_id}, Score {self.score}>'
@@ -162,11 +245,15 @@ class Score(db.Model):
 class Answer(db.Model):
     """Answer model recording user's specific answers to questions."""
     __tablename__ = 'answers'
+    __table_args__ = (
+        db.UniqueConstraint('score_id', 'question_id', name='uq_answers_score_question'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     score_id = db.Column(db.Integer, db.ForeignKey('scores.id'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False)
-    choice_id = db.Column(db.Integer, db.ForeignKey('choices.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False, index=True)
+    choice_id = db.Column(db.Integer, db.ForeignKey('choices.id'), nullable=True)
+    selected_option = db.Column(db.SmallInteger, nullable=True)  # 1, 2, 3, or 4
     is_correct = db.Column(db.Boolean, default=False)
     
     question = db.relationship('Question')
@@ -174,19 +261,3 @@ class Answer(db.Model):
     
     def __repr__(self):
         return f'<Answer: Score {self.score_id}, Question {self.question_id}>'
-
-class UserAnswer(db.Model):
-    """User answer model recording a user's specific answer to a question."""
-    __tablename__ = 'user_answers'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    score_id = db.Column(db.Integer, db.ForeignKey('scores.id'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False)
-    selected_option = db.Column(db.Integer, nullable=True)  # 1, 2, 3, or 4
-    is_correct = db.Column(db.Boolean, default=False)
-    
-    score = db.relationship('Score')
-    question = db.relationship('Question')
-    
-    def __repr__(self):
-        return f'<UserAnswer: Score {self.score_id}, Question {self.question_id}>' 
\ No newline at end of file
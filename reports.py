@@ -0,0 +1,252 @@
+"""Admin report aggregation, shared by the reports route and the refresh_reports task"""
+from models import User, Subject, Chapter, Quiz, Score, db
+import datetime
+
+
+REPORT_PERIODS = ('week', 'month', 'quarter', 'year', 'all')
+
+
+def daily_activity(start_date):
+    """Map each calendar day since start_date to its (new users, quiz attempts) counts.
+
+    Both tables are grouped by day in a single UNION ALL statement, so the
+    series costs one round trip whatever the period length.
+    """
+    events = db.union_all(
+        db.select(db.func.date(User.created_at).label('day'),
+                  db.literal(1).label('users'), db.literal(0).label('attempts'))
+        .where(User.created_at >= start_date),
+        db.select(db.func.date(Score.completed_at).label('day'),
+                  db.literal(0).label('users'), db.literal(1).label('attempts'))
+        .where(Score.completed_at >= start_date)
+    ).subquery()
+    rows = db.session.execute(
+        db.select(events.c.day, db.func.sum(events.c.users), db.func.sum(events.c.attempts))
+        .group_by(events.c.day)
+    ).all()
+    # SQLite returns DATE() as text, other backends as a date
+    return {
+        datetime.date.fromisoformat(d) if isinstance(d, str) else d: (users, attempts)
+        for d, users, attempts in rows
+    }
+
+
+def period_counts(column, start_date, prev_period_start):
+    """Count rows in the current and previous report periods in one pass over the table"""
+    return db.session.query(
+        db.func.coalesce(db.func.sum(db.case((column >= start_date, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((column < start_date, 1), else_=0)), 0)
+    ).filter(column >= prev_period_start).one()
+
+
+def build_report(period):
+    """Compute the admin report for one of REPORT_PERIODS"""
+    now = datetime.datetime.utcnow()
+    if period == 'week':
+        start_date = now - datetime.timedelta(days=7)
+    elif period == 'month':
+        start_date = now - datetime.timedelta(days=30)
+    elif period == 'quarter':
+        start_date = now - datetime.timedelta(days=90)
+    elif period == 'year':
+        start_date = now - datetime.timedelta(days=365)
+    else:
+        start_date = datetime.datetime.min
+    
+  
+    if start_date == datetime.datetime.min:
+        prev_period_start = start_date
+    else:
+        prev_period_length = (now - start_date).days
+        prev_period_start = start_date - datetime.timedelta(days=prev_period_length)
+    
+    total_users = User.query.count()
+    new_users, prev_new_users = period_counts(User.created_at, start_date, prev_period_start)
+    
+    current = Score.completed_at >= start_date
+    previous = Score.completed_at < start_date
+    (total_quizzes, prev_total_quizzes, passed, prev_passed,
+     avg_score, prev_avg_score) = db.session.query(
+        db.func.coalesce(db.func.sum(db.case((current, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((previous, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((current & Score.passed, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((previous & Score.passed, 1), else_=0)), 0),
+        db.func.coalesce(db.func.avg(db.case((current, Score.score))), 0),
+        db.func.coalesce(db.func.avg(db.case((previous, Score.score))), 0)
+    ).filter(Score.completed_at >= prev_period_start).one()
+    avg_score = float(avg_score)
+    prev_avg_score = float(prev_avg_score)
+    pass_rate = passed / total_quizzes * 100 if total_quizzes else 0
+    prev_pass_rate = prev_passed / prev_total_quizzes * 100 if prev_total_quizzes else 0
+    
+    user_growth = ((new_users - prev_new_users) / prev_new_users * 100) if prev_new_users > 0 else 0
+    quiz_growth = ((total_quizzes - prev_total_quizzes) / prev_total_quizzes * 100) if prev_total_quizzes > 0 else 0
+    pass_rate_change = pass_rate - prev_pass_rate
+    avg_score_change = avg_score - prev_avg_score
+    
+
+    # The previous period is aggregated alongside the current one so each
+    # subject's trend is its change in average score between the two.
+    current_attempts = db.func.count(db.case((current, Score.id)))
+    top_subjects = db.session.query(
+        Subject.id, 
+        Subject.name, 
+        current_attempts.label('attempts'),
+        db.func.avg(db.case((current, Score.score))).label('avg_score'),
+        db.func.avg(db.case((previous, Score.score))).label('prev_avg_score')
+    ).join(Chapter, Subject.id == Chapter.subject_id)\
+     .join(Quiz, Chapter.id == Quiz.chapter_id)\
+     .join(Score, Quiz.id == Score.quiz_id)\
+     .filter(Score.completed_at >= prev_period_start)\
+     .group_by(Subject.id)\
+     .having(current_attempts > 0)\
+     .order_by(db.desc('attempts'))\
+     .limit(5).all()
+    
+
+    top_quizzes = db.session.query(
+        Quiz.id, 
+        Quiz.title, 
+        db.func.count(Score.id).label('attempts'),
+        db.func.avg(Score.score).label('avg_score'),
+        db.func.sum(db.case([(Score.passed, 1)], else_=0)).label('passed_count')
+    ).join(Score, Quiz.id == Score.quiz_id)\
+     .filter(Score.completed_at >= start_date)\
+     .group_by(Quiz.id)\
+     .order_by(db.desc('attempts'))\
+     .limit(5).all()
+    
+
+    top_users_by_score = db.session.query(
+        User.id, 
+        User.first_name,
+        User.last_name,
+        db.func.avg(Score.score).label('avg_score'),
+        db.func.count(Score.id).label('quiz_count'),
+        db.func.sum(db.case([(Score.passed, 1)], else_=0)).label('passed_count'),
+        db.func.count(db.distinct(Chapter.subject_id)).label('subjects_covered'),
+        db.func.max(Score.completed_at).label('last_activity')
+    ).join(Score, User.id == Score.user_id)\
+     .join(Quiz, Score.quiz_id == Quiz.id)\
+     .join(Chapter, Quiz.chapter_id == Chapter.id)\
+     .filter(Score.completed_at >= start_date)\
+     .group_by(User.id)\
+     .having(db.func.count(Score.id) >= 3)\
+     .order_by(db.desc('avg_score'))\
+     .limit(10).all()
+    
+
+
+    top_users_by_activity = db.session.query(
+        User.id, 
+        User.first_name,
+        User.last_name,
+        db.func.count(Score.id).label('quiz_count'),
+        db.func.avg(Score.score).label('avg_score'),
+        db.func.sum(db.case([(Score.passed, 1)], else_=0)).label('passed_count'),
+        db.func.count(db.distinct(Chapter.subject_id)).label('subjects_covered'),
+        db.func.max(Score.completed_at).label('last_activity')
+    ).join(Score, User.id == Score.user_id)\
+     .join(Quiz, Score.quiz_id == Quiz.id)\
+     .join(Chapter, Quiz.chapter_id == Chapter.id)\
+     .filter(Score.completed_at >= start_date)\
+     .group_by(User.id)\
+     .order_by(db.desc('quiz_count'))\
+     .limit(10).all()
+    
+    activity = daily_activity(start_date)
+    
+    # For period=all the series starts at the first recorded day instead
+    # of datetime.min.
+    first_day = start_date.date()
+    if start_date == datetime.datetime.min:
+        first_day = min(activity, default=now.date())
+    
+    days = []
+    new_users_data = []
+    quiz_attempts_data = []
+    
+    current_date = first_day
+    while current_date <= now.date():
+        days.append(current_date.strftime('%Y-%m-%d'))
+        day_users, day_quizzes = activity.get(current_date, (0, 0))
+        new_users_data.append(day_users)
+        quiz_attempts_data.append(day_quizzes)
+        current_date += datetime.timedelta(days=1)
+    
+
+
+    subject_performance = db.session.query(
+        Subject.name,
+        db.func.avg(Score.score).label('avg_score'),
+        (db.func.sum(db.case([(Score.passed, 1)], else_=0)) * 100.0 / db.func.count(Score.id)).label('pass_rate')
+    ).join(Chapter, Subject.id == Chapter.subject_id)\
+     .join(Quiz, Chapter.id == Quiz.chapter_id)\
+     .join(Score, Quiz.id == Score.quiz_id)\
+     .filter(Score.completed_at >= start_date)\
+     .group_by(Subject.id)\
+     .order_by(db.desc('avg_score'))\
+     .limit(10).all()
+    
+
+
+    results = {
+        'overview': {
+            'totalUsers': total_users,
+            'totalQuizzes': total_quizzes,
+            'passRate': round(pass_rate, 1),
+            'avgScore': round(avg_score, 1),
+            'userGrowth': round(user_growth, 1),
+            'quizGrowth': round(quiz_growth, 1),
+            'passRateChange': round(pass_rate_change, 1),
+            'avgScoreChange': round(avg_score_change, 1)
+        },
+        'topSubjects': [{
+            'id': subject.id,
+            'name': subject.name,
+            'attempts': subject.attempts,
+            'avgScore': round(subject.avg_score, 1),
+            'trend': round(subject.avg_score - subject.prev_avg_score, 1) if subject.prev_avg_score is not None else 0
+        } for subject in top_subjects],
+        'topQuizzes': [{
+            'id': quiz.id,
+            'title': quiz.title,
+            'attempts': quiz.attempts,
+            'avgScore': round(quiz.avg_score, 1),
+            'passRate': round((quiz.passed_count / quiz.attempts) * 100, 1) if quiz.attempts > 0 else 0
+        } for quiz in top_quizzes],
+        'topUsersByScore': [{
+            'id': user.id,
+            'firstName': user.first_name,
+            'lastName': user.last_name,
+            'avgScore': round(user.avg_score, 1),
+            'quizzesTaken': user.quiz_count,
+            'quizzesPassed': user.passed_count,
+            'subjectsCovered': user.subjects_covered,
+            'lastActivity': user.last_activity
+        } for user in top_users_by_score],
+        'topUsersByActivity': [{
+            'id': user.id,
+            'firstName': user.first_name,
+            'lastName': user.last_name,
+            'quizzesTaken': user.quiz_count,
+            'avgScore': round(user.avg_score, 1),
+            'quizzesPassed': user.passed_count,
+            'subjectsCovered': user.subjects_covered,
+            'lastActivity': user.last_activity
+        } for user in top_users_by_activity],
+        'analytics': {
+            'userActivity': {
+                'labels': days,
+                'newUsers': new_users_data,
+                'quizAttempts': quiz_attempts_data
+            },
+            'subjectPerformance': {
+                'labels': [s.name for s in subject_performance],
+                'avgScores': [round(s.avg_score, 1) for s in subject_performance],
+                'passRates': [round(s.pass_rate, 1) for s in subject_performance]
+            }
+        }
+    }
+    
+    return results
@@ -1,86 +1,72 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token, create_refresh_token
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, create_access_token, create_refresh_token
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from models import (
-    User, Subject, Chapter, Quiz, Question, Choice, Score, Answer, UserAnswer, db
+    User, Subject, Chapter, Quiz, Question, Choice, Score, Answer, db
 )
-import redis
-import json
+from serializers import jsonify
+from schemas import RegisterSchema, QuizSchema, ValidationError, error_response
+from cache import (
+    bump_generation, buffer_last_login, cache_response, claim_report_refresh, get_or_set,
+    get_redis, load_report, make_cache_key, make_keyset, over_rate_limit, rate_limit_hits,
+    release_report_refresh, safe_delete_cache, CATALOG_TIMEOUT, AVAILABILITY_TIMEOUT, USER_TIMEOUT
+)
+from reports import build_report, REPORT_PERIODS
+from collections import namedtuple
 from functools import wraps
 import datetime
 import random
 import os
 from celery import Celery
-from tasks import export_user_quizzes_as_csv
+from tasks import export_user_quizzes_as_csv, refresh_reports
 import logging
 
 
 
 api_bp = Blueprint('api', __name__)
+logger = logging.getLogger(__name__)
 
-redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-try:
-    redis_client = redis.from_url(redis_url)
-    redis_available = True
-except redis.exceptions.ConnectionError:
-    redis_available = False
-    print("Warning: Redis connection failed, caching disabled")
+LOGIN_RATE_LIMIT = 10
+LOGIN_RATE_WINDOW = 60
 
-CACHE_TIMEOUT = 300  
+register_schema = RegisterSchema()
+quiz_schema = QuizSchema()
 
+CurrentUser = namedtuple('CurrentUser', 'id email role is_active')
 
 
+def get_current_user():
+    """Return the id, email, role and active flag of the user the JWT belongs to"""
+    email = get_jwt_identity()
+    
+    def load():
+        user = User.query.filter_by(email=email).first()
+        if not user:
+            return None
+        return CurrentUser(user.id, user.email, user.role, user.is_active)
+    
+    params = {'email': email}
+    return get_or_set(make_cache_key('user', params), USER_TIMEOUT, load, make_keyset('user', params))
 
-def cache_response(timeout=CACHE_TIMEOUT):
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            if not redis_available:
-                return f(*args, **kwargs)
-                
-            try:
-                
-                cache_key = f'cache:{f.__name__}:{str(args)}:{str(kwargs)}'
-                cached_response = redis_client.get(cache_key)
-                
-                if cached_response:
-                    return json.loads(cached_response)
-                
-                
-                response = f(*args, **kwargs)
-             
-                redis_client.setex(
-                    cache_key,
-                    timeout,
-                    json.dumps(response)
-                )
-                
-                return response
-            except Exception as e:
-                print(f"Cache error: {e}")
-                return f(*args, **kwargs)
-                
-        return decorated_function
-    return decorator
 
+def invalidate_quiz_views(chapter_id, quiz_id=None, subject_id=None):
+    """Drop every cached view showing quizzes of chapter_id.
 
+    subject_id is needed when the chapter's quiz count changes, quiz_id
+    when a single quiz's details do.
+    """
+    safe_delete_cache('get_chapter_quizzes', chapter_id=chapter_id)
+    safe_delete_cache('get_quizzes')
+    if quiz_id is not None:
+        safe_delete_cache('get_quiz', quiz_id=quiz_id)
+    if subject_id is not None:
+        safe_delete_cache('get_chapters', subject_id=subject_id)
 
-def safe_delete_cache(pattern):
-    """Safely delete cache keys matching a pattern"""
-    if not redis_available:
-        return
-        
-    try:
-        redis_client.delete(pattern)
-        try:
-            for key in redis_client.scan_iter(pattern):
-                redis_client.delete(key)
-        except Exception:
-            pass
-            
-    except Exception as e:
-        print(f"Error deleting cache key {pattern}: {e}")
 
+def user_claims(user):
+    """Claims embedded in access tokens so role checks need no database lookup"""
+    return {'role': user.role, 'uid': user.id}
 
 
 def admin_required(f):
@@ -90,46 +76,70 @@ def admin_required(f):
             current_user_email = get_jwt_identity()
             if not current_user_email:
                 return jsonify({'error': 'Authentication required'}), 401
-                
-            user = User.query.filter_by(email=current_user_email).first()
             
-            if not user or user.role != 'admin':
+            if current_user_role() != 'admin':
                 return jsonify({'error': 'Admin privileges required'}), 403
-            
-            return f(*args, **kwargs)
         except Exception as e:
-            print(f"Admin authorization error: {e}")
+            logger.exception("Admin authorization error")
             return jsonify({'error': 'Authentication error'}), 401
+        
+        return f(*args, **kwargs)
     return decorated_function
 
 
+
+def current_user_role():
+    role = get_jwt().get('role')
+    if role is None:
+        # Tokens issued before the role claim was added
+        user = get_current_user()
+        role = user.role if user else ''
+    return role
+
+
+def current_user_id():
+    user_id = get_jwt().get('uid')
+    if user_id is None:
+        # Tokens issued before the uid claim was added
+        user = get_current_user()
+        user_id = user.id if user else None
+    return user_id
+
+
 # Auth routes
 @api_bp.route('/auth/register', methods=['POST'])
 def register():
-    data = request.json
-    
-    required_fields = ['username', 'email', 'password']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required fields'}), 400
-    
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': 'Email already registered'}), 409
-    
-    if User.query.filter_by(username=data['username']).first():
+    try:
+        data = register_schema.load(request.json or {})
+    except ValidationError as e:
+        return jsonify(error_response(e)), 400
+    
+    taken = db.session.query(User.email).filter(
+        (User.email == data['email']) | (User.username == data['username'])
+    ).first()
+    if taken:
+        if taken.email == data['email']:
+            return jsonify({'error': 'Email already registered'}), 409
         return jsonify({'error': 'Username already taken'}), 409
     
     user = User(
         username=data['username'],
         email=data['email'],
-        first_name=data.get('first_name', ''),
-        last_name=data.get('last_name', '')
+        first_name=data['first_name'],
+        last_name=data['last_name']
     )
     user.set_password(data['password'])
     
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent registration for the same email/username
+        db.session.rollback()
+        return jsonify({'error': 'Email or username already registered'}), 409
+    bump_generation('user')
     
-    access_token = create_access_token(identity=user.email)
+    access_token = create_access_token(identity=user.email, additional_claims=user_claims(user))
     refresh_token = create_refresh_token(identity=user.email)
     
     return jsonify({
@@ -149,19 +159,32 @@ def login():
     data = request.json
     if not data or not data.get('email') or not data.get('password'):
         return jsonify({'error': 'Missing email or password'}), 400
+    if not isinstance(data['email'], str) or not isinstance(data['password'], str):
+        return jsonify({'error': 'Email and password must be strings'}), 400
+    
+    # Only failed password checks count, per client and account, so one
+    # client guessing passwords cannot lock anyone else out
+    limit_key = f"login:{request.remote_addr}:{data['email'].strip().lower()}"
+    if rate_limit_hits(limit_key) >= LOGIN_RATE_LIMIT:
+        return jsonify({'error': 'Too many login attempts. Please try again later.'}), 429
     
     user = User.query.filter_by(email=data['email']).first()
     
     if not user or not user.check_password(data['password']):
+        over_rate_limit(limit_key, LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW)
         return jsonify({'error': 'Invalid email or password'}), 401
     
     if not user.is_active:
         return jsonify({'error': 'Your account is inactive. Please contact the administrator.'}), 403
     
-    user.last_login = datetime.datetime.utcnow()
-    db.session.commit()
+    # last_login is buffered in Redis and written by the flush_last_logins
+    # beat task, unless this login already has to commit a rehashed password.
+    now = datetime.datetime.utcnow()
+    if db.session.dirty or not buffer_last_login(user.id, now):
+        user.last_login = now
+        db.session.commit()
     
-    access_token = create_access_token(identity=user.email)
+    access_token = create_access_token(identity=user.email, additional_claims=user_claims(user))
     refresh_token = create_refresh_token(identity=user.email)
     
     return jsonify({
@@ -182,9 +205,12 @@ def login():
 @api_bp.route('/auth/refresh', methods=['POST'])
 @jwt_required(refresh=True)
 def refresh():
-    current_user = get_jwt_identity()
-    access_token = create_access_token(identity=current_user)
-    refresh_token = create_refresh_token(identity=current_user)
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+    
+    access_token = create_access_token(identity=user.email, additional_claims=user_claims(user))
+    refresh_token = create_refresh_token(identity=user.email)
     
     return jsonify({
         'access_token': access_token,
@@ -213,8 +239,7 @@ def get_user():
 @jwt_required()
 def check_auth():
     """Simple endpoint to validate if token is still valid"""
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -228,22 +253,18 @@ def check_auth():
 
 
 @api_bp.route('/subjects', methods=['GET'])
-@cache_response()
+@cache_response(CATALOG_TIMEOUT)
 def get_subjects():
-    subjects = Subject.query.all()
-    
-    subjects_list = [{
-        'id': subject.id,
-        'name': subject.name,
-        'description': subject.description,
-        'image_url': subject.image_url,
-        'created_at': subject.created_at.isoformat()
-    } for subject in subjects]
+    # orjson encodes the datetime columns itself, so rows go straight to dicts
+    subjects = db.session.query(
+        Subject.id, Subject.name, Subject.description,
+        Subject.image_url, Subject.created_at
+    ).all()
     
-    return jsonify(subjects_list), 200
+    return jsonify([subject._asdict() for subject in subjects]), 200
 
 @api_bp.route('/subjects/<int:subject_id>', methods=['GET'])
-@cache_response()
+@cache_response(CATALOG_TIMEOUT)
 def get_subject(subject_id):
     subject = Subject.query.get_or_404(subject_id)
     
@@ -252,14 +273,14 @@ def get_subject(subject_id):
         'name': chapter.name,
         'description': chapter.description,
         'order': chapter.order
-    } for chapter in subject.chapters.order_by(Chapter.order)]
+    } for chapter in Chapter.query.filter_by(subject_id=subject_id).order_by(Chapter.order)]
     
     return jsonify({
         'id': subject.id,
         'name': subject.name,
         'description': subject.description,
         'image_url': subject.image_url,
-        'created_at': subject.created_at.isoformat(),
+        'created_at': subject.created_at,
         'chapters': chapters
     }), 200
 
@@ -282,7 +303,8 @@ def create_subject():
     try:
         db.session.add(subject)
         db.session.commit()
-        safe_delete_cache('cache:get_subjects:():{}')
+        safe_delete_cache('get_subjects')
+        bump_generation('catalog')
         
         return jsonify({
             'message': 'Subject created successfully',
@@ -299,16 +321,17 @@ def create_subject():
 
 @api_bp.route('/subjects/<int:subject_id>/chapters', methods=['GET'])
 @jwt_required()
-@cache_response()
+@cache_response(CATALOG_TIMEOUT)
 def get_chapters(subject_id):
     subject = Subject.query.get_or_404(subject_id)
-    chapters = Chapter.query.filter_by(subject_id=subject_id).order_by(Chapter.order).all()
+    chapters = Chapter.query.options(db.undefer(Chapter.quiz_count))\
+        .filter_by(subject_id=subject_id).order_by(Chapter.order).all()
     chapters_list = [{
         'id': chapter.id,
         'name': chapter.name,
         'description': chapter.description,
         'order': chapter.order,
-        'quiz_count': chapter.quizzes.count()
+        'quiz_count': chapter.quiz_count
     } for chapter in chapters]
     
     return jsonify(chapters_list), 200
@@ -328,12 +351,12 @@ def create_chapter(subject_id):
         max_order = db.session.query(db.func.max(Chapter.order)).filter_by(subject_id=subject_id).scalar() or 0
         order = data.get('order', max_order + 1)
         
-        existing_chapter = Chapter.query.filter_by(subject_id=subject_id, name=data['name']).first()
-        if existing_chapter:
+        existing_chapter_id = db.session.query(Chapter.id).filter_by(subject_id=subject_id, name=data['name']).limit(1).scalar()
+        if existing_chapter_id:
             return jsonify({
                 'error': 'A chapter with this name already exists in this subject',
-                'id': existing_chapter.id,
-                'name': existing_chapter.name,
+                'id': existing_chapter_id,
+                'name': data['name'],
                 'subject_id': subject_id
             }), 409
 
@@ -348,8 +371,9 @@ def create_chapter(subject_id):
         db.session.add(chapter)
         db.session.commit()
         
-        safe_delete_cache(f'cache:get_chapters:():{{"subject_id": {subject_id}}}')
-        safe_delete_cache(f'cache:get_subject:():{{"subject_id": {subject_id}}}')
+        safe_delete_cache('get_chapters', subject_id=subject_id)
+        safe_delete_cache('get_subject', subject_id=subject_id)
+        bump_generation('catalog')
         
         return jsonify({
             'id': chapter.id,
@@ -361,7 +385,7 @@ def create_chapter(subject_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error creating chapter: {e}")
+        logger.exception("Error creating chapter")
         return jsonify({'error': f'Failed to create chapter: {str(e)}'}), 500
 
 
@@ -377,13 +401,13 @@ def update_chapter(chapter_id):
         if not data or not data.get('name'):
             return jsonify({'error': 'Chapter name is required'}), 400
         
-        existing_chapter = Chapter.query.filter(
+        name_taken = db.session.query(Chapter.query.filter(
             Chapter.subject_id == chapter.subject_id,
             Chapter.name == data['name'],
             Chapter.id != chapter_id
-        ).first()
+        ).exists()).scalar()
         
-        if existing_chapter:
+        if name_taken:
             return jsonify({
                 'error': 'Another chapter with this name already exists in this subject'
             }), 409
@@ -395,9 +419,10 @@ def update_chapter(chapter_id):
         
         db.session.commit()
         
-        safe_delete_cache(f'cache:get_chapters:():{{"subject_id": {chapter.subject_id}}}')
-        safe_delete_cache(f'cache:get_subject:():{{"subject_id": {chapter.subject_id}}}')
-        safe_delete_cache(f'cache:get_chapter:():{{"chapter_id": {chapter_id}}}')
+        safe_delete_cache('get_chapters', subject_id=chapter.subject_id)
+        safe_delete_cache('get_subject', subject_id=chapter.subject_id)
+        safe_delete_cache('get_quizzes')
+        bump_generation('catalog')
         
         return jsonify({
             'id': chapter.id,
@@ -409,7 +434,7 @@ def update_chapter(chapter_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating chapter: {e}")
+        logger.exception("Error updating chapter")
         return jsonify({'error': f'Failed to update chapter: {str(e)}'}), 500
 
 
@@ -420,8 +445,8 @@ def update_chapter(chapter_id):
 @admin_required
 def delete_chapter(chapter_id):
     try:
-        chapter = Chapter.query.get_or_404(chapter_id)
-        quiz_count = chapter.quizzes.count()
+        chapter = Chapter.query.options(db.undefer(Chapter.quiz_count)).get_or_404(chapter_id)
+        quiz_count = chapter.quiz_count
         if quiz_count > 0:
             return jsonify({
                 'error': 'Cannot delete chapter with existing quizzes',
@@ -432,12 +457,13 @@ def delete_chapter(chapter_id):
         subject_id = chapter.subject_id
         chapter_name = chapter.name 
         
-        db.session.delete(chapter)
+        # Nothing left to cascade to, so skip loading the empty collection
+        Chapter.query.filter_by(id=chapter_id).delete(synchronize_session=False)
         db.session.commit()
         
-        safe_delete_cache(f'cache:get_chapters:():{{"subject_id": {subject_id}}}')
-        safe_delete_cache(f'cache:get_subject:():{{"subject_id": {subject_id}}}')
-        safe_delete_cache(f'cache:get_chapter:():{{"chapter_id": {chapter_id}}}')
+        safe_delete_cache('get_chapters', subject_id=subject_id)
+        safe_delete_cache('get_subject', subject_id=subject_id)
+        bump_generation('catalog')
         
         return jsonify({
             'message': f'Chapter "{chapter_name}" deleted successfully',
@@ -447,7 +473,7 @@ def delete_chapter(chapter_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting chapter: {e}")
+        logger.exception("Error deleting chapter")
         return jsonify({'error': f'Failed to delete chapter: {str(e)}'}), 500
 
 
@@ -456,53 +482,39 @@ def delete_chapter(chapter_id):
 # quiz ke routes
 @api_bp.route('/quizzes', methods=['GET'])
 @jwt_required()
-@cache_response()
+@cache_response(AVAILABILITY_TIMEOUT, vary=current_user_role)
 def get_quizzes():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    role = current_user_role()
     
-    if user.role == 'admin':
-        quizzes = Quiz.query.all()
-    else:
-        now = datetime.datetime.utcnow()
-        quizzes = Quiz.query.filter(
-            Quiz.is_active == True,
-            (Quiz.start_date == None) | (Quiz.start_date <= now),
-            (Quiz.end_date == None) | (Quiz.end_date >= now)
-        ).all()
+    # Select the listing columns directly rather than hydrating Quiz,
+    # Chapter and Subject objects only to read a few fields off them.
+    query = db.session.query(
+        Quiz.id, Quiz.title, Quiz.description, Quiz.chapter_id,
+        Chapter.name.label('chapter_name'), Chapter.subject_id,
+        Subject.name.label('subject_name'), Quiz.duration_minutes,
+        Quiz.start_date, Quiz.end_date, Quiz.question_count,
+        Quiz.is_available.label('is_available')
+    ).join(Chapter, Quiz.chapter_id == Chapter.id)\
+     .join(Subject, Chapter.subject_id == Subject.id)
+    if role != 'admin':
+        query = query.filter(Quiz.is_available)
     
-
-    quizzes_list = [{
-        'id': quiz.id,
-        'title': quiz.title,
-        'description': quiz.description,
-        'chapter_id': quiz.chapter_id,
-        'chapter_name': quiz.chapter.name,
-        'subject_id': quiz.chapter.subject_id,
-        'subject_name': quiz.chapter.subject.name,
-        'duration_minutes': quiz.duration_minutes,
-        'start_date': quiz.start_date.isoformat() if quiz.start_date else None,
-        'end_date': quiz.end_date.isoformat() if quiz.end_date else None,
-        'question_count': quiz.questions.count(),
-        'is_available': quiz.is_available
-    } for quiz in quizzes]
-    
-    return jsonify(quizzes_list), 200
+    return jsonify([quiz._asdict() for quiz in query.all()]), 200
 
 
 
 
 @api_bp.route('/quizzes/<int:quiz_id>', methods=['GET'])
 @jwt_required()
-@cache_response()
+@cache_response(AVAILABILITY_TIMEOUT, vary=current_user_role)
 def get_quiz(quiz_id):
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
+        role = current_user_role()
         
-        quiz = Quiz.query.get_or_404(quiz_id)
+        quiz = Quiz.query.options(db.undefer(Quiz.question_count), joinedload(Quiz.chapter))\
+            .get_or_404(quiz_id)
         
-        if user.role != 'admin':
+        if role != 'admin':
             now = datetime.datetime.utcnow()
             if not quiz.is_active:
                 return jsonify({'error': 'This quiz is not available'}), 403
@@ -513,7 +525,7 @@ def get_quiz(quiz_id):
             if quiz.end_date and quiz.end_date < now:
                 return jsonify({'error': 'This quiz has expired'}), 403
         
-        chapter = Chapter.query.get(quiz.chapter_id)
+        chapter = quiz.chapter
         
         quiz_data = {
             'id': quiz.id,
@@ -521,10 +533,10 @@ def get_quiz(quiz_id):
             'description': quiz.description,
             'duration_minutes': quiz.duration_minutes,
             'passing_score': quiz.passing_score,
-            'start_date': quiz.start_date.isoformat() if quiz.start_date else None,
-            'end_date': quiz.end_date.isoformat() if quiz.end_date else None,
+            'start_date': quiz.start_date,
+            'end_date': quiz.end_date,
             'is_active': quiz.is_active,
-            'question_count': quiz.questions.count(),
+            'question_count': quiz.question_count,
             'chapter': {
                 'id': chapter.id,
                 'name': chapter.name,
@@ -535,7 +547,7 @@ def get_quiz(quiz_id):
         return jsonify(quiz_data), 200
         
     except Exception as e:
-        print(f"Error fetching quiz: {e}")
+        logger.exception("Error fetching quiz")
         return jsonify({'error': f'Failed to fetch quiz: {str(e)}'}), 500
 
 
@@ -559,8 +571,10 @@ def update_subject(subject_id):
     
     db.session.commit()
     
-    redis_client.delete('cache:get_subjects:():{}')
-    redis_client.delete(f'cache:get_subject:():{{"subject_id": {subject_id}}}')
+    safe_delete_cache('get_subjects')
+    safe_delete_cache('get_subject', subject_id=subject_id)
+    safe_delete_cache('get_quizzes')
+    bump_generation('catalog')
     
     return jsonify({
         'message': 'Subject updated successfully',
@@ -574,16 +588,17 @@ def update_subject(subject_id):
 @jwt_required()
 @admin_required
 def delete_subject(subject_id):
-    subject = Subject.query.get_or_404(subject_id)
+    Subject.query.get_or_404(subject_id)
     
-    if subject.chapters.count() > 0:
+    if db.session.query(Chapter.query.filter_by(subject_id=subject_id).exists()).scalar():
         return jsonify({'error': 'Cannot delete subject with existing chapters'}), 400
     
-    db.session.delete(subject)
+    Subject.query.filter_by(id=subject_id).delete(synchronize_session=False)
     db.session.commit()
     
-    redis_client.delete('cache:get_subjects:():{}')
-    redis_client.delete(f'cache:get_subject:():{{"subject_id": {subject_id}}}')
+    safe_delete_cache('get_subjects')
+    safe_delete_cache('get_subject', subject_id=subject_id)
+    bump_generation('catalog')
     
     return jsonify({'message': 'Subject deleted successfully'}), 200
 
@@ -593,32 +608,23 @@ def delete_subject(subject_id):
 @jwt_required()
 def get_user_scores():
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
-        scores = Score.query.filter_by(user_id=user.id).order_by(Score.completed_at.desc()).all()
-        
-        scores_list = []
-        for score in scores:
-            quiz = Quiz.query.get(score.quiz_id)
-            chapter = Chapter.query.get(quiz.chapter_id) if quiz else None
-            subject = Subject.query.get(chapter.subject_id) if chapter else None
-            
-            scores_list.append({
-                'id': score.id,
-                'quiz_id': score.quiz_id,
-                'quiz_title': quiz.title if quiz else 'Unknown Quiz',
-                'chapter_name': chapter.name if chapter else 'Unknown Chapter',
-                'subject_name': subject.name if subject else 'Unknown Subject',
-                'score': score.score,
-                'passed': score.passed,
-                'time_taken': score.time_taken,
-                'completed_at': score.completed_at.isoformat() if score.completed_at else None,
-            })
-        
-        return jsonify(scores_list), 200
+        user_id = current_user_id()
+        scores = db.session.query(
+            Score.id, Score.quiz_id,
+            db.func.coalesce(Quiz.title, 'Unknown Quiz').label('quiz_title'),
+            db.func.coalesce(Chapter.name, 'Unknown Chapter').label('chapter_name'),
+            db.func.coalesce(Subject.name, 'Unknown Subject').label('subject_name'),
+            Score.score, Score.passed, Score.time_taken, Score.completed_at
+        ).outerjoin(Quiz, Score.quiz_id == Quiz.id)\
+         .outerjoin(Chapter, Quiz.chapter_id == Chapter.id)\
+         .outerjoin(Subject, Chapter.subject_id == Subject.id)\
+         .filter(Score.user_id == user_id)\
+         .order_by(Score.completed_at.desc()).all()
+        
+        return jsonify([score._asdict() for score in scores]), 200
         
     except Exception as e:
-        print(f"Error fetching user scores: {e}")
+        logger.exception("Error fetching user scores")
         return jsonify({'error': f'Failed to fetch scores: {str(e)}'}), 500
 
 
@@ -627,9 +633,8 @@ def get_user_scores():
 @jwt_required()
 def start_quiz_attempt(quiz_id):
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
-        quiz = Quiz.query.get_or_404(quiz_id)
+        user_id = current_user_id()
+        quiz = Quiz.query.options(db.undefer(Quiz.question_count)).get_or_404(quiz_id)
         
         now = datetime.datetime.utcnow()
         if not quiz.is_active:
@@ -641,11 +646,11 @@ def start_quiz_attempt(quiz_id):
         if quiz.end_date and quiz.end_date < now:
             return jsonify({'error': 'This quiz has expired'}), 403
         
-        questions_count = Question.query.filter_by(quiz_id=quiz_id).count()
+        questions_count = quiz.question_count
         
         
         score = Score(
-            user_id=user.id,
+            user_id=user_id,
             quiz_id=quiz_id,
             score=0.0,  
             time_taken=0,  
@@ -654,6 +659,7 @@ def start_quiz_attempt(quiz_id):
         )
         db.session.add(score)
         db.session.commit()
+        bump_generation('score')
     
         return jsonify({
             'message': 'Quiz attempt initialized successfully',
@@ -665,7 +671,7 @@ def start_quiz_attempt(quiz_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error initializing quiz attempt: {e}")
+        logger.exception("Error initializing quiz attempt")
         return jsonify({'error': f'Failed to initialize quiz attempt: {str(e)}'}), 500
 
 
@@ -675,8 +681,7 @@ def start_quiz_attempt(quiz_id):
 @jwt_required()
 def submit_quiz(quiz_id):
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
+        user_id = current_user_id()
         data = request.json
         if not data:
             return jsonify({'error': 'No data provided'}), 400
@@ -686,63 +691,75 @@ def submit_quiz(quiz_id):
         
         quiz = Quiz.query.get_or_404(quiz_id)
         questions = Question.query.filter_by(quiz_id=quiz_id).all()
+        questions_by_id = {q.id: q for q in questions}
         total_questions = len(questions)
         total_points = sum(q.points for q in questions)
         correct_answers = 0
         
-
-        score = Score(
-            user_id=user.id,
-            quiz_id=quiz_id,
-            score=0.0,  
-            time_taken=time_taken,
-            passed=False,
-            completed_at=datetime.datetime.utcnow()
-        )
-        
-        db.session.add(score)
-        db.session.flush()  
+        choice_ids = [a.get('choice_id') for a in answers if a.get('choice_id')]
+        choices_by_id = {}
+        if choice_ids:
+            choices_by_id = {c.id: c for c in Choice.query.filter(Choice.id.in_(choice_ids)).all()}
         
+        answered = set()
+        answer_rows = []
         for answer_data in answers:
             question_id = answer_data.get('question_id')
             choice_id = answer_data.get('choice_id')
             
-            if not question_id or not choice_id:
+            if not question_id or not choice_id or question_id in answered:
                 continue
             
-            question = Question.query.get(question_id)
-            choice = Choice.query.get(choice_id)
+            question = questions_by_id.get(question_id)
+            choice = choices_by_id.get(choice_id)
             
-            if not question or not choice or question.quiz_id != quiz_id:
+            if not question or not choice or choice.question_id != question_id:
                 continue
+            answered.add(question_id)
             is_correct = choice.is_correct
             
             if is_correct:
                 correct_answers += question.points
             
-            answer = Answer(
-                score_id=score.id,
-                question_id=question_id,
-                choice_id=choice_id,
-                is_correct=is_correct
-            )
-            
-            db.session.add(answer)
+            answer_rows.append({
+                'question_id': question_id,
+                'choice_id': choice_id,
+                'is_correct': is_correct
+            })
         
         if total_points > 0:
-            score.score = (correct_answers / total_points) * 100
+            percentage = (correct_answers / total_points) * 100
         else:
-            score.score = 0
+            percentage = 0
+        passed = percentage >= quiz.passing_score
+        
+        # The result is known before anything is written, so the score row is
+        # inserted once with its final values instead of being updated later.
+        score = Score(
+            user_id=user_id,
+            quiz_id=quiz_id,
+            score=percentage,
+            time_taken=time_taken,
+            passed=passed,
+            completed_at=datetime.datetime.utcnow()
+        )
+        db.session.add(score)
+        db.session.flush()
+        score_id = score.id
         
-        score.passed = score.score >= quiz.passing_score
+        if answer_rows:
+            for row in answer_rows:
+                row['score_id'] = score_id
+            db.session.execute(db.insert(Answer), answer_rows)
         
         db.session.commit()
+        bump_generation('score')
         
         return jsonify({
             'message': 'Quiz submitted successfully',
-            'score_id': score.id,
-            'score': score.score,
-            'passed': score.passed,
+            'score_id': score_id,
+            'score': percentage,
+            'passed': passed,
             'correct_answers': correct_answers,
             'total_questions': total_questions,
             'time_taken': time_taken
@@ -750,7 +767,7 @@ def submit_quiz(quiz_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error submitting quiz: {e}")
+        logger.exception("Error submitting quiz")
         return jsonify({'error': f'Failed to submit quiz: {str(e)}'}), 500
 
 
@@ -758,35 +775,20 @@ def submit_quiz(quiz_id):
 
 @api_bp.route('/chapters/<int:chapter_id>/quizzes', methods=['GET'])
 @jwt_required()
-@cache_response()
+@cache_response(AVAILABILITY_TIMEOUT, vary=current_user_role)
 def get_chapter_quizzes(chapter_id):
     chapter = Chapter.query.get_or_404(chapter_id)
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    role = current_user_role()
     
-    if user.role == 'admin':
-        quizzes = Quiz.query.filter_by(chapter_id=chapter_id).all()
-    else:
-        now = datetime.datetime.utcnow()
-        quizzes = Quiz.query.filter_by(chapter_id=chapter_id).filter(
-            Quiz.is_active == True,
-            (Quiz.start_date == None) | (Quiz.start_date <= now),
-            (Quiz.end_date == None) | (Quiz.end_date >= now)
-        ).all()
+    query = db.session.query(
+        Quiz.id, Quiz.title, Quiz.description, Quiz.duration_minutes,
+        Quiz.passing_score, Quiz.start_date, Quiz.end_date, Quiz.is_active,
+        Quiz.question_count
+    ).filter(Quiz.chapter_id == chapter_id)
+    if role != 'admin':
+        query = query.filter(Quiz.is_available)
     
-    quizzes_list = [{
-        'id': quiz.id,
-        'title': quiz.title,
-        'description': quiz.description,
-        'duration_minutes': quiz.duration_minutes,
-        'passing_score': quiz.passing_score,
-        'start_date': quiz.start_date.isoformat() if quiz.start_date else None,
-        'end_date': quiz.end_date.isoformat() if quiz.end_date else None,
-        'is_active': quiz.is_active,
-        'question_count': quiz.questions.count()
-    } for quiz in quizzes]
-    
-    return jsonify(quizzes_list), 200
+    return jsonify([quiz._asdict() for quiz in query.all()]), 200
 
 
 
@@ -796,48 +798,27 @@ def get_chapter_quizzes(chapter_id):
 @admin_required
 def create_quiz(chapter_id):
     try:
-        chapter = Chapter.query.get_or_404(chapter_id)
-        data = request.json
-        
-        if not data or not data.get('title'):
-            return jsonify({'error': 'Quiz title is required'}), 400
-        
-        existing_quiz = Quiz.query.filter_by(chapter_id=chapter_id, title=data['title']).first()
-        if existing_quiz:
+        data = quiz_schema.load(request.json or {})
+    except ValidationError as e:
+        return jsonify(error_response(e)), 400
+    
+    chapter = Chapter.query.get_or_404(chapter_id)
+    try:
+        existing_quiz_id = db.session.query(Quiz.id).filter_by(chapter_id=chapter_id, title=data['title']).limit(1).scalar()
+        if existing_quiz_id:
             return jsonify({
                 'error': 'A quiz with this title already exists in this chapter',
-                'id': existing_quiz.id,
-                'title': existing_quiz.title
+                'id': existing_quiz_id,
+                'title': data['title']
             }), 409 
         
-        start_date = None
-        end_date = None
-        try:
-            if data.get('start_date'):
-                start_date = datetime.datetime.fromisoformat(data['start_date'])
-            if data.get('end_date'):
-                end_date = datetime.datetime.fromisoformat(data['end_date'])
-            if start_date and end_date and end_date <= start_date:
-                return jsonify({'error': 'End date must be after start date'}), 400
-        except ValueError:
-            return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
-    
-
-        quiz = Quiz(
-            chapter_id=chapter_id,
-            title=data['title'],
-            description=data.get('description', ''),
-            duration_minutes=data.get('duration_minutes', 30),
-            passing_score=data.get('passing_score', 70),
-            start_date=start_date,
-            end_date=end_date,
-            is_active=data.get('is_active', True)
-        )
+        quiz = Quiz(chapter_id=chapter_id, **data)
         
         db.session.add(quiz)
         db.session.commit()
         
-        safe_delete_cache(f'cache:get_chapter_quizzes:():{{"chapter_id": {chapter_id}}}')
+        invalidate_quiz_views(chapter_id, subject_id=chapter.subject_id)
+        bump_generation('catalog')
         
         return jsonify({
             'id': quiz.id,
@@ -847,13 +828,13 @@ def create_quiz(chapter_id):
             'duration_minutes': quiz.duration_minutes,
             'passing_score': quiz.passing_score,
             'is_active': quiz.is_active,
-            'start_date': quiz.start_date.isoformat() if quiz.start_date else None,
-            'end_date': quiz.end_date.isoformat() if quiz.end_date else None
+            'start_date': quiz.start_date,
+            'end_date': quiz.end_date
         }), 201
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error creating quiz: {e}")
+        logger.exception("Error creating quiz")
         return jsonify({'error': f'Failed to create quiz: {str(e)}'}), 500
 
 
@@ -870,12 +851,12 @@ def update_quiz(quiz_id):
             return jsonify({'error': 'No data provided'}), 400
 
         if 'title' in data and data['title'] != quiz.title:
-            existing_quiz = Quiz.query.filter(
+            title_taken = db.session.query(Quiz.query.filter(
                 Quiz.chapter_id == quiz.chapter_id,
                 Quiz.title == data['title'],
                 Quiz.id != quiz_id
-            ).first()
-            if existing_quiz:
+            ).exists()).scalar()
+            if title_taken:
                 return jsonify({
                     'error': 'Another quiz with this title already exists in this chapter'
                 }), 409
@@ -913,7 +894,8 @@ def update_quiz(quiz_id):
         
         db.session.commit()
         
-        safe_delete_cache(f'cache:get_chapter_quizzes:():{{"chapter_id": {quiz.chapter_id}}}')
+        invalidate_quiz_views(quiz.chapter_id, quiz_id)
+        bump_generation('catalog')
         
         return jsonify({
             'id': quiz.id,
@@ -923,13 +905,13 @@ def update_quiz(quiz_id):
             'duration_minutes': quiz.duration_minutes,
             'passing_score': quiz.passing_score,
             'is_active': quiz.is_active,
-            'start_date': quiz.start_date.isoformat() if quiz.start_date else None,
-            'end_date': quiz.end_date.isoformat() if quiz.end_date else None
+            'start_date': quiz.start_date,
+            'end_date': quiz.end_date
         }), 200
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating quiz: {e}")
+        logger.exception("Error updating quiz")
         return jsonify({'error': f'Failed to update quiz: {str(e)}'}), 500
 
 
@@ -939,20 +921,20 @@ def update_quiz(quiz_id):
 @admin_required
 def delete_quiz(quiz_id):
     try:
-        quiz = Quiz.query.get_or_404(quiz_id)
-        question_count = quiz.questions.count()
-        attempt_count = Score.query.filter_by(quiz_id=quiz_id).count()
+        # Only check for questions and attempts with EXISTS; the full
+        # counts are read just for the error message.
+        quiz = Quiz.query.options(joinedload(Quiz.chapter)).get_or_404(quiz_id)
         
-        
-        if question_count > 0:
+        if db.session.query(Question.query.filter_by(quiz_id=quiz_id).exists()).scalar():
+            question_count = quiz.question_count
             return jsonify({
                 'error': 'Cannot delete quiz with existing questions',
                 'message': f'This quiz has {question_count} question(s). Please delete them first.',
                 'question_count': question_count
             }), 400
         
-        
-        if attempt_count > 0:
+        if db.session.query(Score.query.filter_by(quiz_id=quiz_id).exists()).scalar():
+            attempt_count = Score.query.filter_by(quiz_id=quiz_id).count()
             return jsonify({
                 'error': 'Cannot delete quiz that has been attempted by users',
                 'message': f'This quiz has been attempted {attempt_count} time(s). You cannot delete it.',
@@ -960,14 +942,15 @@ def delete_quiz(quiz_id):
             }), 400
         
         chapter_id = quiz.chapter_id
+        subject_id = quiz.chapter.subject_id
         quiz_title = quiz.title  
         
         db.session.delete(quiz)
 
         db.session.commit()
         
-        safe_delete_cache(f'cache:get_chapter_quizzes:():{{"chapter_id": {chapter_id}}}')
-        safe_delete_cache(f'cache:get_quiz:():{{"quiz_id": {quiz_id}}}')
+        invalidate_quiz_views(chapter_id, quiz_id, subject_id)
+        bump_generation('catalog')
         
         return jsonify({
             'message': f'Quiz "{quiz_title}" deleted successfully',
@@ -977,7 +960,7 @@ def delete_quiz(quiz_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting quiz: {e}")
+        logger.exception("Error deleting quiz")
         return jsonify({'error': f'Failed to delete quiz: {str(e)}'}), 500
 
 
@@ -985,13 +968,13 @@ def delete_quiz(quiz_id):
 @api_bp.route('/quizzes/<int:quiz_id>/questions', methods=['GET'])
 @jwt_required()
 def get_questions(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
+    db.session.query(Quiz.id).filter_by(id=quiz_id).first_or_404()
     
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
-    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.id).all()
+    role = current_user_role()
+    questions = Question.query.options(selectinload(Question.choices))\
+        .filter_by(quiz_id=quiz_id).order_by(Question.id).all()
     
-    show_answers = user.role == 'admin'
+    show_answers = role == 'admin'
     
     questions_list = []
     for question in questions:
@@ -1018,22 +1001,28 @@ def get_questions(quiz_id):
 
 
 
+def choice_rows(question_id, choices):
+    """Rows for a single executemany INSERT of a question's choices"""
+    return [{
+        'question_id': question_id,
+        'text': choice_data.get('text', ''),
+        'is_correct': choice_data.get('is_correct', False)
+    } for choice_data in choices]
+
 @api_bp.route('/quizzes/<int:quiz_id>/questions', methods=['POST'])
 @jwt_required()
 @admin_required
 def create_question(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-    
     data = request.json
     
-    if not data or not data.get('text') or not data.get('choices'):
+    choices = data.get('choices') if data else None
+    if not data or not data.get('text') or not choices:
         return jsonify({'error': 'Question text and choices are required'}), 400
     
-    choices = data.get('choices', [])
     if not any(c.get('is_correct') for c in choices):
         return jsonify({'error': 'At least one choice must be marked as correct'}), 400
     
-    
+    chapter_id, = db.session.query(Quiz.chapter_id).filter_by(id=quiz_id).first_or_404()
 
     question = Question(
         quiz_id=quiz_id,
@@ -1045,16 +1034,12 @@ def create_question(quiz_id):
     db.session.add(question)
     db.session.flush()  
     
-    for choice_data in choices:
-        choice = Choice(
-            question_id=question.id,
-            text=choice_data.get('text', ''),
-            is_correct=choice_data.get('is_correct', False)
-        )
-        db.session.add(choice)
+    db.session.execute(db.insert(Choice), choice_rows(question.id, choices))
     
     db.session.commit()
     
+    invalidate_quiz_views(chapter_id, quiz_id)
+    
     return jsonify({
         'message': 'Question created successfully',
         'id': question.id,
@@ -1084,15 +1069,8 @@ def update_question(question_id):
         if not any(c.get('is_correct') for c in choices):
             return jsonify({'error': 'At least one choice must be marked as correct'}), 400
         
-        Choice.query.filter_by(question_id=question_id).delete()
-        
-        for choice_data in choices:
-            choice = Choice(
-                question_id=question_id,
-                text=choice_data.get('text', ''),
-                is_correct=choice_data.get('is_correct', False)
-            )
-            db.session.add(choice)
+        Choice.query.filter_by(question_id=question_id).delete(synchronize_session=False)
+        db.session.execute(db.insert(Choice), choice_rows(question_id, choices))
     
     db.session.commit()
     
@@ -1109,19 +1087,19 @@ def update_question(question_id):
 @jwt_required()
 @admin_required
 def delete_question(question_id):
-    question = Question.query.get_or_404(question_id)
-    quiz_id = question.quiz_id
+    quiz_id, chapter_id = db.session.query(Question.quiz_id, Quiz.chapter_id)\
+        .join(Quiz, Question.quiz_id == Quiz.id)\
+        .filter(Question.id == question_id).first_or_404()
     
-
-
-    if Answer.query.filter_by(question_id=question_id).count() > 0:
+    if db.session.query(Answer.query.filter_by(question_id=question_id).exists()).scalar():
         return jsonify({'error': 'Cannot delete a question that has been answered by users'}), 400
     
-    Choice.query.filter_by(question_id=question_id).delete()
-    
-    db.session.delete(question)
+    Choice.query.filter_by(question_id=question_id).delete(synchronize_session=False)
+    Question.query.filter_by(id=question_id).delete(synchronize_session=False)
     db.session.commit()
     
+    invalidate_quiz_views(chapter_id, quiz_id)
+    
     return jsonify({'message': 'Question deleted successfully'}), 200
 
 
@@ -1131,22 +1109,19 @@ def delete_question(question_id):
 @jwt_required()
 @admin_required
 def get_all_users():
-    users = User.query.all()
+    # Count every user's attempts in one GROUP BY pass over scores rather
+    # than one correlated COUNT per user row.
+    quiz_counts = db.session.query(
+        Score.user_id, db.func.count(Score.id).label('quiz_count')
+    ).group_by(Score.user_id).subquery()
     
-    users_list = [{
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'first_name': user.first_name,
-        'last_name': user.last_name,
-        'role': user.role,
-        'created_at': user.created_at.isoformat(),
-        'last_login': user.last_login.isoformat() if user.last_login else None,
-        'is_active': user.is_active,
-        'quiz_count': Score.query.filter_by(user_id=user.id).count()
-    } for user in users]
+    users = db.session.query(
+        User.id, User.username, User.email, User.first_name, User.last_name,
+        User.role, User.created_at, User.last_login, User.is_active,
+        db.func.coalesce(quiz_counts.c.quiz_count, 0).label('quiz_count')
+    ).outerjoin(quiz_counts, quiz_counts.c.user_id == User.id).all()
     
-    return jsonify(users_list), 200
+    return jsonify([user._asdict() for user in users]), 200
 
 @api_bp.route('/admin/users/<int:user_id>/status', methods=['PUT'])
 @jwt_required()
@@ -1160,6 +1135,7 @@ def update_user_status(user_id):
     
     user.is_active = data['is_active']
     db.session.commit()
+    safe_delete_cache('user', email=user.email)
     
     return jsonify({
         'message': 'User status updated successfully',
@@ -1172,16 +1148,14 @@ def update_user_status(user_id):
 @jwt_required()
 @admin_required
 def get_user_stats(user_id):
-    user = User.query.get_or_404(user_id)
-    
-   
-    scores = Score.query.filter_by(user_id=user_id).all()
-    
-  
-    quizzes_taken = len(scores)
-    quizzes_passed = sum(1 for score in scores if score.passed)
-    average_score = sum(score.score for score in scores) / quizzes_taken if quizzes_taken > 0 else 0
+    db.session.query(User.id).filter_by(id=user_id).first_or_404()
     
+    quizzes_taken, quizzes_passed, average_score, last_activity = db.session.query(
+        db.func.count(Score.id),
+        db.func.coalesce(db.func.sum(db.case((Score.passed, 1), else_=0)), 0),
+        db.func.coalesce(db.func.avg(Score.score), 0),
+        db.func.max(Score.completed_at)
+    ).filter(Score.user_id == user_id).one()
     
     covered_subjects = db.session.query(Subject.id, Subject.name)\
         .join(Chapter, Subject.id == Chapter.subject_id)\
@@ -1190,18 +1164,14 @@ def get_user_stats(user_id):
         .filter(Score.user_id == user_id)\
         .distinct().all()
     
-    
-    last_activity = db.session.query(db.func.max(Score.completed_at))\
-        .filter(Score.user_id == user_id).scalar()
-    
     return jsonify({
         'user_id': user_id,
         'quizzesTaken': quizzes_taken,
         'quizzesPassed': quizzes_passed,
-        'averageScore': round(average_score, 1),
+        'averageScore': round(float(average_score), 1),
         'subjectsCovered': len(covered_subjects),
         'subjects': [{'id': s.id, 'name': s.name} for s in covered_subjects],
-        'lastActivity': last_activity.isoformat() if last_activity else None
+        'lastActivity': last_activity
     }), 200
 
 
@@ -1224,210 +1194,29 @@ def export_users():
 @admin_required
 def get_reports():
     period = request.args.get('period', 'month')
+    if period not in REPORT_PERIODS:
+        period = 'all'
     
-    now = datetime.datetime.utcnow()
-    if period == 'week':
-        start_date = now - datetime.timedelta(days=7)
-    elif period == 'month':
-        start_date = now - datetime.timedelta(days=30)
-    elif period == 'quarter':
-        start_date = now - datetime.timedelta(days=90)
-    elif period == 'year':
-        start_date = now - datetime.timedelta(days=365)
-    else:
-        start_date = datetime.datetime.min
-    
-  
-    prev_period_length = (now - start_date).days
-    prev_period_start = start_date - datetime.timedelta(days=prev_period_length)
-    
-    total_users = User.query.count()
-    new_users = User.query.filter(User.created_at >= start_date).count()
-    total_quizzes = Score.query.filter(Score.completed_at >= start_date).count()
-    
-    prev_new_users = User.query.filter(
-        User.created_at >= prev_period_start,
-        User.created_at < start_date
-    ).count()
-    prev_total_quizzes = Score.query.filter(
-        Score.completed_at >= prev_period_start,
-        Score.completed_at < start_date
-    ).count()
-    
-    scores = Score.query.filter(Score.completed_at >= start_date).all()
-    pass_rate = sum(1 for s in scores if s.passed) / len(scores) * 100 if scores else 0
-    avg_score = sum(s.score for s in scores) / len(scores) if scores else 0
-    
-    prev_scores = Score.query.filter(
-        Score.completed_at >= prev_period_start,
-        Score.completed_at < start_date
-    ).all()
-    prev_pass_rate = sum(1 for s in prev_scores if s.passed) / len(prev_scores) * 100 if prev_scores else 0
-    prev_avg_score = sum(s.score for s in prev_scores) / len(prev_scores) if prev_scores else 0
-    
-    user_growth = ((new_users - prev_new_users) / prev_new_users * 100) if prev_new_users > 0 else 0
-    quiz_growth = ((total_quizzes - prev_total_quizzes) / prev_total_quizzes * 100) if prev_total_quizzes > 0 else 0
-    pass_rate_change = pass_rate - prev_pass_rate
-    avg_score_change = avg_score - prev_avg_score
-    
-
-    top_subjects = db.session.query(
-        Subject.id, 
-        Subject.name, 
-        db.func.count(Score.id).label('attempts'),
-        db.func.avg(Score.score).label('avg_score')
-    ).join(Chapter, Subject.id == Chapter.subject_id)\
-     .join(Quiz, Chapter.id == Quiz.chapter_id)\
-     .join(Score, Quiz.id == Score.quiz_id)\
-     .filter(Score.completed_at >= start_date)\
-     .group_by(Subject.id)\
-     .order_by(db.desc('attempts'))\
-     .limit(5).all()
-    
-
-    top_quizzes = db.session.query(
-        Quiz.id, 
-        Quiz.title, 
-        db.func.count(Score.id).label('attempts'),
-        db.func.avg(Score.score).label('avg_score'),
-        db.func.sum(db.case([(Score.passed, 1)], else_=0)).label('passed_count')
-    ).join(Score, Quiz.id == Score.quiz_id)\
-     .filter(Score.completed_at >= start_date)\
-     .group_by(Quiz.id)\
-     .order_by(db.desc('attempts'))\
-     .limit(5).all()
-    
-
-    top_users_by_score = db.session.query(
-        User.id, 
-        User.first_name,
-        User.last_name,
-        db.func.avg(Score.score).label('avg_score'),
-        db.func.count(Score.id).label('quiz_count'),
-        db.func.sum(db.case([(Score.passed, 1)], else_=0)).label('passed_count')
-    ).join(Score, User.id == Score.user_id)\
-     .filter(Score.completed_at >= start_date)\
-     .group_by(User.id)\
-     .having(db.func.count(Score.id) >= 3)\
-     .order_by(db.desc('avg_score'))\
-     .limit(10).all()
-    
-
-
-    top_users_by_activity = db.session.query(
-        User.id, 
-        User.first_name,
-        User.last_name,
-        db.func.count(Score.id).label('quiz_count'),
-        db.func.avg(Score.score).label('avg_score'),
-        db.func.sum(db.case([(Score.passed, 1)], else_=0)).label('passed_count')
-    ).join(Score, User.id == Score.user_id)\
-     .filter(Score.completed_at >= start_date)\
-     .group_by(User.id)\
-     .order_by(db.desc('quiz_count'))\
-     .limit(10).all()
-    
-    days = []
-    new_users_data = []
-    quiz_attempts_data = []
-    
-    current_date = start_date
-    while current_date <= now:
-        day_str = current_date.strftime('%Y-%m-%d')
-        days.append(day_str)
-        
-       
-        day_users = User.query.filter(
-            User.created_at >= current_date,
-            User.created_at < current_date + datetime.timedelta(days=1)
-        ).count()
-        new_users_data.append(day_users)
-        
-        
-        day_quizzes = Score.query.filter(
-            Score.completed_at >= current_date,
-            Score.completed_at < current_date + datetime.timedelta(days=1)
-        ).count()
-        quiz_attempts_data.append(day_quizzes)
-        
-        current_date += datetime.timedelta(days=1)
-    
-
-
-    subject_performance = db.session.query(
-        Subject.name,
-        db.func.avg(Score.score).label('avg_score'),
-        db.func.sum(db.case([(Score.passed, 1)], else_=0)) * 100.0 / db.func.count(Score.id).label('pass_rate')
-    ).join(Chapter, Subject.id == Chapter.subject_id)\
-     .join(Quiz, Chapter.id == Quiz.chapter_id)\
-     .join(Score, Quiz.id == Score.quiz_id)\
-     .filter(Score.completed_at >= start_date)\
-     .group_by(Subject.id)\
-     .order_by(db.desc('avg_score'))\
-     .limit(10).all()
-    
-
-
-    results = {
-        'overview': {
-            'totalUsers': total_users,
-            'totalQuizzes': total_quizzes,
-            'passRate': round(pass_rate, 1),
-            'avgScore': round(avg_score, 1),
-            'userGrowth': round(user_growth, 1),
-            'quizGrowth': round(quiz_growth, 1),
-            'passRateChange': round(pass_rate_change, 1),
-            'avgScoreChange': round(avg_score_change, 1)
-        },
-        'topSubjects': [{
-            'id': subject.id,
-            'name': subject.name,
-            'attempts': subject.attempts,
-            'avgScore': round(subject.avg_score, 1),
-            'trend': round(random.uniform(-10, 10), 1) 
-        } for subject in top_subjects],
-        'topQuizzes': [{
-            'id': quiz.id,
-            'title': quiz.title,
-            'attempts': quiz.attempts,
-            'avgScore': round(quiz.avg_score, 1),
-            'passRate': round((quiz.passed_count / quiz.attempts) * 100, 1) if quiz.attempts > 0 else 0
-        } for quiz in top_quizzes],
-        'topUsersByScore': [{
-            'id': user.id,
-            'firstName': user.first_name,
-            'lastName': user.last_name,
-            'avgScore': round(user.avg_score, 1),
-            'quizzesTaken': user.quiz_count,
-            'quizzesPassed': user.passed_count,
-            'subjectsCovered': random.randint(1, 5),  
-            'lastActivity': (now - datetime.timedelta(days=random.randint(0, 30))).isoformat()
-        } for user in top_users_by_score],
-        'topUsersByActivity': [{
-            'id': user.id,
-            'firstName': user.first_name,
-            'lastName': user.last_name,
-            'quizzesTaken': user.quiz_count,
-            'avgScore': round(user.avg_score, 1),
-            'quizzesPassed': user.passed_count,
-            'subjectsCovered': random.randint(1, 5),  
-            'lastActivity': (now - datetime.timedelta(days=random.randint(0, 30))).isoformat()
-        } for user in top_users_by_activity],
-        'analytics': {
-            'userActivity': {
-                'labels': days,
-                'newUsers': new_users_data,
-                'quizAttempts': quiz_attempts_data
-            },
-            'subjectPerformance': {
-                'labels': [s.name for s in subject_performance],
-                'avgScores': [round(s.avg_score, 1) for s in subject_performance],
-                'passRates': [round(s.pass_rate, 1) for s in subject_performance]
-            }
-        }
-    }
+    body = load_report(period)
+    if body is not None:
+        return current_app.response_class(body, mimetype='application/json')
+    
+    # Reports are built by the refresh_reports beat task; a miss means the
+    # period has not been built yet or Redis is unavailable. Only the first
+    # miss queues a rebuild; later ones wait for it.
+    if get_redis() is not None:
+        try:
+            if claim_report_refresh(period):
+                refresh_reports.delay(period)
+            return jsonify({
+                'message': 'Report is being prepared, try again shortly',
+                'period': period
+            }), 202
+        except Exception:
+            logger.exception("Could not queue report refresh")
+            release_report_refresh(period)
     
-    return jsonify(results), 200
+    return jsonify(build_report(period)), 200
 
 @api_bp.route('/admin/reports/export', methods=['GET'])
 @jwt_required()
@@ -1442,20 +1231,19 @@ def export_report():
 @jwt_required()
 def get_quiz_questions_for_attempt(quiz_id):
     try:
-        quiz = Quiz.query.get_or_404(quiz_id)
+        db.session.query(Quiz.id).filter_by(id=quiz_id).first_or_404()
         
-        questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.order).all()
+        questions = Question.query.options(selectinload(Question.choices))\
+            .filter_by(quiz_id=quiz_id).order_by(Question.order).all()
         
         questions_list = []
         for question in questions:
-            choices = Choice.query.filter_by(question_id=question.id).all()
-            
+            # Draw the choices in random order instead of building the list
+            # and shuffling it afterwards
             choices_list = [{
                 'id': choice.id,
                 'text': choice.text,
-            } for choice in choices]
-            
-            random.shuffle(choices_list)
+            } for choice in random.sample(question.choices, len(question.choices))]
             
             questions_list.append({
                 'id': question.id,
@@ -1468,7 +1256,7 @@ def get_quiz_questions_for_attempt(quiz_id):
         return jsonify(questions_list), 200
         
     except Exception as e:
-        print(f"Error fetching quiz questions: {e}")
+        logger.exception("Error fetching quiz questions")
         return jsonify({'error': f'Failed to fetch quiz questions: {str(e)}'}), 500
 
 
@@ -1479,34 +1267,23 @@ def get_quiz_questions_for_attempt(quiz_id):
 @jwt_required()
 def get_dashboard_stats():
     try:
-        current_user_email = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_email).first()
-        scores = Score.query.filter_by(user_id=user.id).all()
-        
-        completed = len(scores)
-        passed = sum(1 for score in scores if score.passed)
-        
-       
-
-        average_score = 0
-        if completed > 0:
-            average_score = sum(score.score for score in scores) / completed
-        
-        
-        avg_time_seconds = 0
-        if completed > 0:
-            avg_time_seconds = sum(score.time_taken for score in scores) / completed
-        
+        user_id = current_user_id()
+        completed, passed, average_score, avg_time_seconds = db.session.query(
+            db.func.count(Score.id),
+            db.func.coalesce(db.func.sum(db.case((Score.passed, 1), else_=0)), 0),
+            db.func.coalesce(db.func.avg(Score.score), 0),
+            db.func.coalesce(db.func.avg(Score.time_taken), 0)
+        ).filter(Score.user_id == user_id).one()
         
         return jsonify({
             'completed': completed,
             'passed': passed,
-            'average_score': round(average_score, 1),
+            'average_score': round(float(average_score), 1),
             'avg_time_seconds': int(avg_time_seconds)
         }), 200
         
     except Exception as e:
-        print(f"Error fetching dashboard stats: {e}")
+        logger.exception("Error fetching dashboard stats")
         return jsonify({'error': f'Failed to fetch dashboard stats: {str(e)}'}), 500
 
 
@@ -1515,9 +1292,9 @@ def get_dashboard_stats():
 @jwt_required()
 def trigger_score_export():
     """Trigger CSV export of user's quiz scores."""
-    current_user_id = get_jwt_identity()
+    user_id = current_user_id()
     
-    task = export_user_quizzes_as_csv.delay(current_user_id)
+    task = export_user_quizzes_as_csv.delay(user_id)
     
     return jsonify({
         'message': 'Export started successfully',
@@ -1538,7 +1315,7 @@ def check_export_status(task_id):
         try:
             state = task_result.state
         except AttributeError:
-            logging.error(f"Backend error when checking task {task_id}. This is likely due to the result backend not being properly configured.")
+            logger.error("Backend error when checking task %s. This is likely due to the result backend not being properly configured.", task_id)
             return jsonify({
                 'state': 'UNKNOWN',
                 'status': 'Task status cannot be checked. The email will still be sent when the export is complete.'
@@ -1564,7 +1341,7 @@ def check_export_status(task_id):
         
         return jsonify(response)
     except Exception as e:
-        logging.error(f"Error checking task status: {str(e)}")
+        logger.exception("Error checking task status")
         return jsonify({
             'state': 'ERROR',
             'status': 'Error checking export status. The email will still be sent when the export is complete.'
@@ -0,0 +1,62 @@
+from datetime import datetime
+from marshmallow import EXCLUDE, Schema, ValidationError, fields, post_load, validate, validates_schema
+
+
+class IsoDateTime(fields.Field):
+    """Datetime parsed with datetime.fromisoformat; a blank value means no date"""
+    default_error_messages = {'invalid': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError) as error:
+            raise self.make_error('invalid') from error
+
+
+class RegisterSchema(Schema):
+    """Body of POST /auth/register"""
+    class Meta:
+        unknown = EXCLUDE
+
+    username = fields.Str(required=True, validate=validate.Length(min=1, max=32))
+    email = fields.Email(required=True, validate=validate.Length(max=120))
+    password = fields.Str(required=True, validate=validate.Length(min=1))
+    first_name = fields.Str(load_default='', allow_none=True, validate=validate.Length(max=64))
+    last_name = fields.Str(load_default='', allow_none=True, validate=validate.Length(max=64))
+
+    @post_load
+    def blank_names(self, data, **kwargs):
+        # Clients send null for names they leave out
+        for name in ('first_name', 'last_name'):
+            if data[name] is None:
+                data[name] = ''
+        return data
+
+
+class QuizSchema(Schema):
+    """Body of POST /chapters/<id>/quizzes"""
+    class Meta:
+        unknown = EXCLUDE
+
+    title = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+    description = fields.Str(load_default='', allow_none=True)
+    duration_minutes = fields.Int(load_default=30, validate=validate.Range(min=1, max=32767))
+    passing_score = fields.Int(load_default=70, validate=validate.Range(min=0, max=100))
+    start_date = IsoDateTime(load_default=None, allow_none=True)
+    end_date = IsoDateTime(load_default=None, allow_none=True)
+    is_active = fields.Bool(load_default=True)
+
+    @validates_schema
+    def check_dates(self, data, **kwargs):
+        if data['start_date'] and data['end_date'] and data['end_date'] <= data['start_date']:
+            raise ValidationError('End date must be after start date', 'end_date')
+
+
+def error_response(error):
+    """Error body for a failed load: one readable message plus the per-field details"""
+    field, messages = next(iter(error.messages.items()))
+    if isinstance(messages, dict):
+        messages = next(iter(messages.values()))
+    return {'error': f'{field}: {messages[0]}', 'fields': error.messages}
@@ -1,8 +1,7 @@
 #!/usr/bin/env python
 
 from app import create_app
-from models import db, User, Subject, Chapter, Quiz, Question, Choice, Score
-from werkzeug.security import generate_password_hash
+from models import db, User, Subject, Chapter, Quiz, Question, Choice, Score, password_hasher
 from datetime import datetime, timedelta
 import random
 
@@ -19,7 +18,7 @@ def create_users():
             email='admin@gmail.com',
             first_name='Admin',
             last_name='User',
-            password_hash=generate_password_hash('Admin@123'),
+            password_hash=password_hasher.hash('Admin@123'),
             role='admin',
             is_active=True
         )
@@ -68,7 +67,7 @@ def create_users():
             email=user_data['email'],
             first_name=user_data['first_name'],
             last_name=user_data['last_name'],
-            password_hash=generate_password_hash(user_data['password']),
+            password_hash=password_hasher.hash(user_data['password']),
             role='user',
             is_active=True
         )
@@ -80,6 +79,25 @@ def create_users():
 
 
 
+def insert_rows(model, rows, *natural_key):
+    """Insert rows with a single executemany INSERT and return them as model objects.
+
+    RETURNING is not available for executemany here, so the new rows are
+    read back by natural_key, whose first column is the parent foreign key.
+    """
+    if not rows:
+        return []
+    
+    db.session.execute(db.insert(model), rows)
+    
+    parent = natural_key[0]
+    keys = {tuple(row[column] for column in natural_key) for row in rows}
+    candidates = model.query.filter(
+        getattr(model, parent).in_({row[parent] for row in rows})
+    ).order_by(model.id)
+    return [obj for obj in candidates if tuple(getattr(obj, column) for column in natural_key) in keys]
+
+
 def create_subjects():
     """Create 3 sample subjects"""
     print("creating sample subjects")
@@ -128,23 +146,21 @@ def create_chapters(subjects):
     """Create 3 chapters for each subject"""
     print("creating sample chapters")  
     created_chapters = []
+    rows = []
     
     for subject in subjects:
         if Chapter.query.filter_by(subject_id=subject.id).count() >= 5:
             created_chapters.extend(Chapter.query.filter_by(subject_id=subject.id).all())
             continue
             
-        for i in range(1, 4):
-            chapter = Chapter(
-                subject_id=subject.id,
-                name=f"Chapter {i}: {subject.name} Basics {i}",
-                description=f"Introduction to {subject.name} concepts - Part {i}",
-                order=i
-            )
-            db.session.add(chapter)
-            db.session.flush()
-            created_chapters.append(chapter)
-    
+        rows.extend({
+            'subject_id': subject.id,
+            'name': f"Chapter {i}: {subject.name} Basics {i}",
+            'description': f"Introduction to {subject.name} concepts - Part {i}",
+            'order': i
+        } for i in range(1, 4))
+    
+    created_chapters.extend(insert_rows(Chapter, rows, 'subject_id', 'name'))
     db.session.commit()
     print("chapters created successfully")   
     return created_chapters
@@ -155,6 +171,7 @@ def create_quizzes(chapters):
     """Create 3 quizzes for each chapter"""
     print("creating sample quizzes")  
     created_quizzes = []
+    rows = []
     now = datetime.utcnow()
     
     for chapter in chapters:
@@ -162,21 +179,18 @@ def create_quizzes(chapters):
             created_quizzes.extend(Quiz.query.filter_by(chapter_id=chapter.id).all())
             continue
             
-        for i in range(1, 4):
-            quiz = Quiz(
-                chapter_id=chapter.id,
-                title=f"Quiz {i} - {chapter.name}",
-                description=f"Test your {chapter.name}",
-                duration_minutes=random.choice([15, 30, 45, 60]),
-                passing_score=60,
-                start_date=now - timedelta(days=i),
-                end_date=now + timedelta(days=30),
-                is_active=True
-            )
-            db.session.add(quiz)
-            db.session.flush()
-            created_quizzes.append(quiz)
-    
+        rows.extend({
+            'chapter_id': chapter.id,
+            'title': f"Quiz {i} - {chapter.name}",
+            'description': f"Test your {chapter.name}",
+            'duration_minutes': random.choice([15, 30, 45, 60]),
+            'passing_score': 60,
+            'start_date': now - timedelta(days=i),
+            'end_date': now + timedelta(days=30),
+            'is_active': True
+        } for i in range(1, 4))
+    
+    created_quizzes.extend(insert_rows(Quiz, rows, 'chapter_id', 'title'))
     db.session.commit()
     print("quizzes created successfully")
     
@@ -188,30 +202,35 @@ def create_questions(quizzes):
     """Create 3 questions for each quiz"""
     print("creating sample questions")
     
+    rows = []
+    numbers = {}
+    
     for quiz in quizzes:
         if Question.query.filter_by(quiz_id=quiz.id).count() >= 3:
             continue
             
         for i in range(1, 4):
-            question = Question(
-                quiz_id=quiz.id,
-                text=f"Question {i} about {quiz.title}?",
-                explanation=f"Explanation for question {i}",
-                points=random.choice([1, 2, 3, 5])
-            )
-            db.session.add(question)
-            db.session.flush()
-            
-    
-            correct_choice = random.randint(0, 3)
-            for j in range(4):
-                choice = Choice(
-                    question_id=question.id,
-                    text=f"Option {j+1} for question {i}",
-                    is_correct=(j == correct_choice)
-                )
-                db.session.add(choice)
-    
+            text = f"Question {i} about {quiz.title}?"
+            rows.append({
+                'quiz_id': quiz.id,
+                'text': text,
+                'explanation': f"Explanation for question {i}",
+                'points': random.choice([1, 2, 3, 5])
+            })
+            numbers[(quiz.id, text)] = i
+    
+    choice_rows = []
+    for question in insert_rows(Question, rows, 'quiz_id', 'text'):
+        i = numbers[(question.quiz_id, question.text)]
+        correct_choice = random.randint(0, 3)
+        choice_rows.extend({
+            'question_id': question.id,
+            'text': f"Option {j+1} for question {i}",
+            'is_correct': j == correct_choice
+        } for j in range(4))
+    
+    if choice_rows:
+        db.session.execute(db.insert(Choice), choice_rows)
     db.session.commit()
     print("questions and options created successfully!")
 
@@ -0,0 +1,26 @@
+from flask import Request, current_app
+from kombu.serialization import register
+import orjson
+
+
+def dumps(obj):
+    """Encode obj to JSON bytes"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def loads(data):
+    """Decode JSON from bytes or str"""
+    return orjson.loads(data)
+
+
+def jsonify(data):
+    """Drop-in for flask.jsonify that encodes with orjson"""
+    return current_app.response_class(dumps(data), mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+class JSONRequest(Request):
+    """Request that parses JSON bodies with orjson"""
+    json_module = orjson
+
+
+register('orjson', dumps, loads, content_type='application/x-orjson', content_encoding='utf-8')
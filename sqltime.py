@@ -0,0 +1,54 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from cache import get_redis
+import hashlib
+import logging
+import redis
+import time
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERIES_KEY = 'slow_queries'
+SLOW_QUERIES_KEPT = 200
+
+_slow_query_ns = None
+
+
+def init_app(app):
+    """Log statements slower than SLOW_QUERY_MS when QUERY_PROFILING is on"""
+    global _slow_query_ns
+    if not app.config.get('QUERY_PROFILING'):
+        return
+    first_init = _slow_query_ns is None
+    _slow_query_ns = app.config.get('SLOW_QUERY_MS', 50) * 1_000_000
+    if first_init:
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter_ns())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter_ns() - conn.info['query_start'].pop()
+    if duration > _slow_query_ns:
+        record_slow_query(statement, duration / 1_000_000)
+
+
+def record_slow_query(statement, duration_ms):
+    """Keep the slowest statements in a capped Redis sorted set"""
+    logger.warning("Slow query (%.1f ms): %s", duration_ms, statement)
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    digest = hashlib.sha1(statement.encode()).hexdigest()[:12]
+    try:
+        pipe = redis_client.pipeline()
+        pipe.zadd(SLOW_QUERIES_KEY, {f'{digest}:{statement[:200]}': duration_ms}, gt=True)
+        pipe.zremrangebyrank(SLOW_QUERIES_KEY, 0, -SLOW_QUERIES_KEPT - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("Error recording slow query: %s", e)
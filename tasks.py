@@ -1,35 +1,150 @@
+from celery import group, signals
 from celery_app import celery, db
-from models import User, Quiz, Score
+from cache import redis_client, generation, get_or_set, get_redis, make_cache_key, release_report_refresh, report_stamp, store_report, touch_report, LAST_LOGIN_BUFFER
+from models import User, Subject, Chapter, Quiz, Score
+from reports import build_report, REPORT_PERIODS
+import serializers
+from sqlalchemy import bindparam
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import csv
 import io
+import logging
 import smtplib
+import tempfile
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 import os
+import queue
+import re
+import redis
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from dotenv import load_dotenv
 
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
 SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
 FROM_EMAIL = os.environ.get('FROM_EMAIL', 'noreply@quizmaster.com')
+SMTP_TIMEOUT = int(os.environ.get('SMTP_TIMEOUT', 10))
+SMTP_WORKERS = int(os.environ.get('SMTP_WORKERS', 4))
+EMAIL_CHUNK_SIZE = int(os.environ.get('EMAIL_CHUNK_SIZE', 100))
+SMTP_HEALTH_WINDOW = 300
+SMTP_HEALTH_MIN_ATTEMPTS = 30
+CSV_SPOOL_SIZE = 4 * 1024 * 1024
+RUN_CACHE_TIMEOUT = 3600
 
 
 GCHAT_WEBHOOK_URL = os.environ.get('GCHAT_WEBHOOK_URL')
+GCHAT_TIMEOUT = (3.05, 5)
 
-def send_email(to_email, subject, body, attachment=None):
-    """Send email with optional attachment"""
+# Keep-alive connections to the webhook, with a few quick retries for
+# connection failures
+_gchat_session = requests.Session()
+_gchat_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.2)
+))
+
+class SMTPBatch:
+    """One logged-in SMTP connection reused for successive messages.
+
+    The connection is opened on the first message, so an idle one never
+    connects, and reopened once if the server drops it. Any other failure
+    mid-send drops the connection, since the session may be left out of
+    step with the server, and the next message starts a fresh one.
+    """
+    def __init__(self):
+        self.server = None
+    
+    def connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            server.starttls()
+            server.login(SMTP_USERNAME, SMTP_PASSWORD)
+        except BaseException:
+            server.close()
+            raise
+        return server
+    
+    def send(self, msg):
+        try:
+            try:
+                if self.server is None:
+                    self.server = self.connect()
+                self.server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self.reset()
+                self.server = self.connect()
+                self.server.send_message(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused):
+            # smtplib has already sent RSET, so the session is still usable
+            raise
+        except BaseException:
+            self.reset()
+            raise
+    
+    def reset(self):
+        """Drop the connection without the QUIT round trip a broken session may not answer"""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+    
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+# Each worker process keeps up to SMTP_WORKERS connections open between
+# tasks. A task waits for a free one, so concurrent greenlets never share a
+# connection, and the most recently used one is handed out first so a quiet
+# process only keeps one connection busy.
+_smtp_pool = queue.LifoQueue()
+for _ in range(SMTP_WORKERS):
+    _smtp_pool.put(SMTPBatch())
+
+
+@contextmanager
+def pooled_smtp():
+    """Borrow one of this process's shared SMTP connections for the block"""
+    batch = _smtp_pool.get()
+    try:
+        yield batch
+    finally:
+        _smtp_pool.put(batch)
+
+
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def close_smtp_pool(**kwargs):
+    while not _smtp_pool.empty():
+        _smtp_pool.get_nowait().close()
+
+
+def smtp_configured():
     if not all([SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD]):
         print("Email configuration missing. Skipping email send.")
         return False
-        
+    return True
+
+
+def build_message(to_email, subject, body, attachment=None):
+    """Build an HTML email with an optional CSV attachment"""
     msg = MIMEMultipart()
     msg['From'] = FROM_EMAIL
     msg['To'] = to_email
@@ -41,12 +156,17 @@ def send_email(to_email, subject, body, attachment=None):
         part = MIMEApplication(attachment, Name='quiz_results.csv')
         part['Content-Disposition'] = f'attachment; filename="quiz_results.csv"'
         msg.attach(part)
+    return msg
+
+
+def send_email(to_email, subject, body, attachment=None):
+    """Send email with optional attachment"""
+    if not smtp_configured():
+        return False
     
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
+        with pooled_smtp() as server:
+            server.send(build_message(to_email, subject, body, attachment))
         return True
     except Exception as e:
         print(f"Error sending email: {e}")
@@ -59,9 +179,10 @@ def send_gchat_notification(message):
         return False
         
     try:
-        response = requests.post(
+        response = _gchat_session.post(
             GCHAT_WEBHOOK_URL,
-            json={'text': message}
+            json={'text': message},
+            timeout=GCHAT_TIMEOUT
         )
         response.raise_for_status()
         return True
@@ -69,40 +190,147 @@ def send_gchat_notification(message):
         print(f"Error sending Google Chat notification: {e}")
         return False
 
+def already_sent(key):
+    """Check whether a delivery recorded with mark_sent has already happened"""
+    try:
+        return bool(redis_client.exists(key))
+    except redis.RedisError:
+        return False
+
+def mark_sent(key, ttl):
+    """Record a delivery so a redelivered task does not repeat it"""
+    try:
+        redis_client.set(key, 1, nx=True, ex=ttl)
+    except redis.RedisError:
+        pass
+
+def smtp_health_key():
+    return f"smtp-health:{int(time.time() // SMTP_HEALTH_WINDOW)}"
+
+def record_delivery(delivered):
+    """Count a delivery attempt, shared by every worker, towards the current window"""
+    key = smtp_health_key()
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hincrby(key, 'sent' if delivered else 'failed', 1)
+        pipe.expire(key, SMTP_HEALTH_WINDOW * 2)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+def smtp_failing():
+    """Whether more than a third of this window's delivery attempts have failed"""
+    try:
+        sent, failed = redis_client.hmget(smtp_health_key(), 'sent', 'failed')
+    except redis.RedisError:
+        return False
+    sent, failed = int(sent or 0), int(failed or 0)
+    attempts = sent + failed
+    return attempts >= SMTP_HEALTH_MIN_ATTEMPTS and failed * 3 > attempts
+
+
+@celery.task(
+    bind=True,
+    ignore_result=True,
+    autoretry_for=(smtplib.SMTPException, OSError),
+    retry_backoff=True,
+    max_retries=3
+)
+def send_one_email(self, to_email, subject, body, sent_key, sent_ttl):
+    """Deliver one message queued by a batch task, retrying it on its own if SMTP fails.
+
+    Deliveries are recorded with mark_sent, so a retried or redelivered
+    message that already went out is not sent again. While the SMTP server
+    is failing most attempts, queued messages wait out the window instead
+    of each spending a connection attempt on it.
+    """
+    if already_sent(sent_key) or not smtp_configured():
+        return
+    if smtp_failing():
+        raise self.retry(countdown=SMTP_HEALTH_WINDOW)
+    
+    try:
+        with pooled_smtp() as server:
+            server.send(build_message(to_email, subject, body))
+    except smtplib.SMTPRecipientsRefused as e:
+        # Retrying cannot help a rejected address, and it says nothing about
+        # the server's health
+        logger.warning("Recipient refused, not retrying: %s", e.recipients)
+        return
+    except (smtplib.SMTPException, OSError):
+        record_delivery(False)
+        raise
+    record_delivery(True)
+    mark_sent(sent_key, sent_ttl)
+
+
+def queue_emails(jobs):
+    """Queue the send_one_email signatures collected in jobs as one group and empty it.
+
+    Batch tasks call this every EMAIL_CHUNK_SIZE messages, so only one chunk
+    of message bodies is held in memory at a time. Returns how many were queued.
+    """
+    queued = len(jobs)
+    if jobs:
+        group(jobs).apply_async()
+        jobs.clear()
+    return queued
+
 
 
 @celery.task
 def send_daily_reminders():
-    """Send daily reminders to inactive users about new quizzes"""
+    """Send daily reminders to inactive users about new quizzes.
+
+    Tasks are acknowledged late, so this may run again after a worker is lost;
+    users already reminded today are skipped.
+    """
     inactive_threshold = datetime.utcnow() - timedelta(days=7)
     inactive_users = User.query.filter(
         User.last_login < inactive_threshold,
         User.is_active == True
     ).all()
     
-    new_quizzes = Quiz.query.filter(
-        Quiz.created_at >= inactive_threshold,
-        Quiz.is_active == True
-    ).all()
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    
+    # Retries and manual runs on the same day reuse the first run's list
+    new_quizzes = get_or_set(
+        make_cache_key('new_quizzes', {'day': today}),
+        RUN_CACHE_TIMEOUT,
+        lambda: [title for title, in db.session.query(Quiz.title).filter(
+            Quiz.created_at >= inactive_threshold,
+            Quiz.is_active == True
+        )]
+    )
     
     if not new_quizzes:
         return "No new quizzes to notify about"
     
-    quiz_list = "\n".join([f"- {quiz.title}" for quiz in new_quizzes])
+    quiz_list = "\n".join([f"- {title}" for title in new_quizzes])
     
+    # Every reminder is the same message, so it is built once for all users
+    subject = "New Quizzes Available!"
+    body = f"""
+    <h2>Welcome back to Quiz Master!</h2>
+    <p>We noticed you haven't been active lately. Here are some new quizzes you might be interested in:</p>
+    {quiz_list}
+    <p>Log in to your account to start taking these quizzes!</p>
+    """
+    
+    jobs = []
+    queued = 0
     for user in inactive_users:
-        subject = "New Quizzes Available!"
-        body = f"""
-        <h2>Welcome back to Quiz Master!</h2>
-        <p>We noticed you haven't been active lately. Here are some new quizzes you might be interested in:</p>
-        {quiz_list}
-        <p>Log in to your account to start taking these quizzes!</p>
-        """
-        
-        send_email(user.email, subject, body)
+        sent_key = f"daily-reminder:{user.id}:{today}"
+        if already_sent(sent_key):
+            continue
         
-        message = f"Daily reminder sent to {user.email} about {len(new_quizzes)} new quizzes"
-        send_gchat_notification(message)
+        jobs.append(send_one_email.s(user.email, subject, body, sent_key, 60 * 60 * 24))
+        if len(jobs) >= EMAIL_CHUNK_SIZE:
+            queued += queue_emails(jobs)
+    
+    queued += queue_emails(jobs)
+    if queued:
+        send_gchat_notification(f"Daily reminders queued for {queued} users about {len(new_quizzes)} new quizzes")
     
     return f"Sent reminders to {len(inactive_users)} inactive users"
 
@@ -110,42 +338,83 @@ def send_daily_reminders():
 
 
 
+REPORT_ROW = """
+            <tr>
+                <td>%s</td>
+                <td>%.1f%%</td>
+                <td>%.1f minutes</td>
+                <td>%s</td>
+            </tr>"""
+PASS_FAIL = ('Failed', 'Passed')
+
+
 @celery.task
 def generate_monthly_reports():
-    """Generate and send monthly activity reports to users"""
+    """Generate and send monthly activity reports to users.
+
+    Tasks are acknowledged late, so this may run again after a worker is lost;
+    users who already received this month's report are skipped.
+    """
     users = User.query.filter_by(is_active=True).all()
+    month = datetime.utcnow().strftime('%Y-%m')
+    last_month = datetime.utcnow() - timedelta(days=30)
+    
+    def load_monthly_stats():
+        # Every user's totals for the month and their rank by average score,
+        # in one grouped query instead of one query per user
+        monthly_stats = db.session.query(
+            Score.user_id,
+            db.func.count(Score.id).label('total_quizzes'),
+            db.func.sum(db.case((Score.passed, 1), else_=0)).label('passed_quizzes'),
+            db.func.avg(Score.score).label('avg_score'),
+            db.func.coalesce(db.func.avg(Score.time_taken), 0).label('avg_time'),
+            db.func.rank().over(order_by=db.func.avg(Score.score).desc()).label('rank')
+        ).filter(Score.completed_at >= last_month).group_by(Score.user_id)
+        return {row.user_id: row._asdict() for row in monthly_stats}
     
+    # Retries and manual runs within the hour reuse the first run's figures
+    stats_by_user = get_or_set(
+        make_cache_key('monthly_stats', {'month': month}), RUN_CACHE_TIMEOUT, load_monthly_stats
+    )
+    
+    # Each user's five most recent results for the table, for everyone at once
+    recent = db.session.query(
+        Score.user_id, Quiz.title, Score.score, Score.time_taken, Score.passed,
+        db.func.row_number().over(
+            partition_by=Score.user_id, order_by=Score.completed_at.desc()
+        ).label('position')
+    ).join(Quiz, Score.quiz_id == Quiz.id).filter(
+        Score.completed_at >= last_month
+    ).subquery()
+    recent_by_user = defaultdict(list)
+    for user_id, *result in db.session.query(
+        recent.c.user_id, recent.c.title, recent.c.score, recent.c.time_taken, recent.c.passed
+    ).filter(recent.c.position <= 5).order_by(recent.c.user_id, recent.c.position):
+        recent_by_user[user_id].append(result)
+    
+    jobs = []
+    queued = 0
     for user in users:
-        last_month = datetime.utcnow() - timedelta(days=30)
-        scores = Score.query.filter(
-            Score.user_id == user.id,
-            Score.completed_at >= last_month
-        ).all()
+        stats = stats_by_user.get(user.id)
+        if not stats:
+            continue
         
-        if not scores:
+        sent_key = f"monthly-report:{user.id}:{month}"
+        if already_sent(sent_key):
             continue
         
-
-        total_quizzes = len(scores)
-        passed_quizzes = sum(1 for score in scores if score.passed)
-        avg_score = sum(score.score for score in scores) / total_quizzes
-        avg_time = sum(score.time_taken for score in scores) / total_quizzes
+        scores = recent_by_user[user.id]
         
-        all_scores = Score.query.filter(Score.completed_at >= last_month).all()
-        user_scores = {score.user_id: score.score for score in all_scores}
-        sorted_users = sorted(user_scores.items(), key=lambda x: x[1], reverse=True)
-        user_rank = next(i for i, (uid, _) in enumerate(sorted_users, 1) if uid == user.id)
+        total_quizzes = stats['total_quizzes']
+        passed_quizzes = stats['passed_quizzes']
+        avg_score = stats['avg_score']
+        avg_time = stats['avg_time']
+        user_rank = stats['rank']
         
-        table_rows = []
-        for score in scores[:5]:
-            row = f"""
-            <tr>
-                <td>{score.quiz.title}</td>
-                <td>{score.score:.1f}%</td>
-                <td>{score.time_taken/60:.1f} minutes</td>
-                <td>{'Passed' if score.passed else 'Failed'}</td>
-            </tr>"""
-            table_rows.append(row)
+        table_rows = [
+            REPORT_ROW % (title, score, time_taken / 60, PASS_FAIL[bool(passed)])
+            for title, score, time_taken, passed in scores
+        ]
         
         subject = "Your Monthly Quiz Master Report"
         body = f"""
@@ -171,21 +440,63 @@ def generate_monthly_reports():
         </table>
         """
         
-        send_email(user.email, subject, body)
-        
-
-        message = f"Monthly report sent to {user.email}"
-        send_gchat_notification(message)
+        jobs.append(send_one_email.s(user.email, subject, body, sent_key, 60 * 60 * 24 * 32))
+        if len(jobs) >= EMAIL_CHUNK_SIZE:
+            queued += queue_emails(jobs)
+    
+    queued += queue_emails(jobs)
+    if queued:
+        send_gchat_notification(f"Monthly reports queued for {queued} users")
     
     return f"Generated and sent reports to {len(users)} users"
 
-@celery.task
-def export_user_quizzes_as_csv(user_id):
-    """Export a user's quiz attempts as CSV"""
+# The export has a fixed layout, so rows are formatted in one call instead of
+# going through csv.writer cell by cell; only the free-text columns can need
+# quoting
+CSV_ROW = '{},{},{},{:.1f}%,{:.1f},{},{:%Y-%m-%d %H:%M:%S}\r\n'.format
+CSV_SPECIAL = re.compile(r'[,"\r\n]')
+YES_NO = ('No', 'Yes')
+
+
+def csv_field(value):
+    """Quote a text field the way csv.writer does, only when it contains a delimiter, quote or newline"""
+    if CSV_SPECIAL.search(value):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+@celery.task(bind=True)
+def export_user_quizzes_as_csv(self, user_id):
+    """Export a user's quiz attempts as CSV.
+
+    Tasks are acknowledged late, so a redelivered export checks whether this
+    task already emailed its attachment before sending it again.
+    """
+    sent_key = f"export:{self.request.id}"
+    if already_sent(sent_key):
+        return f"Export {self.request.id} was already sent"
+    
     user = User.query.get_or_404(user_id)
-    scores = Score.query.filter_by(user_id=user_id).order_by(Score.completed_at.desc()).all()
+    rows = db.session.execute(
+        db.select(
+            Quiz.title, Subject.name, Chapter.name, Score.score,
+            Score.time_taken, Score.passed, Score.completed_at
+        )
+        .select_from(Score)
+        .join(Quiz, Score.quiz_id == Quiz.id)
+        .join(Chapter, Quiz.chapter_id == Chapter.id)
+        .join(Subject, Chapter.subject_id == Subject.id)
+        .where(Score.user_id == user_id)
+        .order_by(Score.completed_at.desc())
+        .execution_options(stream_results=True, yield_per=1000)
+    )
     
-    output = io.StringIO()
+    # Rows are encoded as they are written; the file only spills to disk for
+    # very long histories
+    output = io.TextIOWrapper(
+        tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_SIZE),
+        encoding='utf-8', newline=''
+    )
     writer = csv.writer(output)
     
     writer.writerow([
@@ -193,18 +504,23 @@ def export_user_quizzes_as_csv(user_id):
         'Passed', 'Completed At'
     ])
     
-    for score in scores:
-        writer.writerow([
-            score.quiz.title,
-            score.quiz.chapter.subject.name,
-            score.quiz.chapter.name,
-            f"{score.score:.1f}%",
-            f"{score.time_taken/60:.1f}",
-            'Yes' if score.passed else 'No',
-            score.completed_at.strftime('%Y-%m-%d %H:%M:%S')
-        ])
+    exported = 0
+    for quiz_title, subject_name, chapter_name, score, time_taken, passed, completed_at in rows:
+        output.write(CSV_ROW(
+            csv_field(quiz_title),
+            csv_field(subject_name),
+            csv_field(chapter_name),
+            score,
+            time_taken / 60,
+            YES_NO[bool(passed)],
+            completed_at
+        ))
+        exported += 1
     
-    csv_data = output.getvalue()
+    output.flush()
+    output.buffer.seek(0)
+    csv_data = output.buffer.read()
+    output.close()
 
 
     subject = "Your Quiz Results Export"
@@ -214,14 +530,69 @@ def export_user_quizzes_as_csv(user_id):
     <p>Please find your quiz results attached to this email.</p>
     """
     
-    send_email(user.email, subject, body, csv_data.encode())
+    if send_email(user.email, subject, body, csv_data):
+        mark_sent(sent_key, 60 * 60 * 24)
     
     # g chat notification
     message = f"Quiz results export sent to {user.email}"
     send_gchat_notification(message)
     
-    return f"Exported {len(scores)} quiz attempts for user {user.email}" 
+    return f"Exported {exported} quiz attempts for user {user.email}" 
+
 
 
 
 
+
+
+@celery.task(ignore_result=True)
+def flush_last_logins():
+    """Write login times buffered by the login route to users.last_login"""
+    flushing = f"{LAST_LOGIN_BUFFER}:flushing"
+    try:
+        # RENAME is atomic, so logins arriving during the flush go to a fresh
+        # hash. A batch left behind by a failed run is written first.
+        if not redis_client.exists(flushing):
+            redis_client.rename(LAST_LOGIN_BUFFER, flushing)
+        pending = redis_client.hgetall(flushing)
+    except redis.ResponseError:
+        return "No logins to record"
+    except redis.RedisError as e:
+        logger.warning("Error reading buffered logins: %s", e)
+        return "Could not read buffered logins"
+    
+    if pending:
+        users = User.__table__
+        db.session.execute(
+            users.update().where(users.c.id == bindparam('uid')).values(last_login=bindparam('ts')),
+            [{'uid': int(uid), 'ts': datetime.fromisoformat(ts.decode())} for uid, ts in pending.items()]
+        )
+        db.session.commit()
+    redis_client.delete(flushing)
+    
+    return f"Recorded {len(pending)} logins"
+
+
+@celery.task(ignore_result=True)
+def refresh_reports(period=None):
+    """Rebuild the admin reports served by the reports route.
+
+    A period is skipped when nothing it shows has changed since it was
+    last built: the stamp is the day plus the score, user and catalog
+    generations bumped by the routes, so an idle system costs no report
+    queries. Skipped reports have their expiry pushed back instead.
+    """
+    if get_redis() is None:
+        return "Redis unavailable, reports not rebuilt"
+    
+    stamp = f"{datetime.utcnow().date()}:{generation('score', 'user', 'catalog')}"
+    built = []
+    for name in ([period] if period else REPORT_PERIODS):
+        if report_stamp(name) == stamp:
+            touch_report(name)
+        else:
+            store_report(name, serializers.dumps(build_report(name)), stamp)
+            built.append(name)
+        release_report_refresh(name)
+    
+    return f"Rebuilt reports: {', '.join(built) or 'none'}"
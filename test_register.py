@@ -0,0 +1,42 @@
+import pytest
+
+from app import create_app
+from config import Config, engine_options
+from database import db
+from models import User
+
+
+@pytest.fixture
+def client(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+
+
+def test_register_accepts_null_names(client):
+    response = client.post('/api/auth/register', json={
+        'username': 'nulls',
+        'email': 'nulls@example.com',
+        'password': 'secret',
+        'first_name': None,
+        'last_name': None
+    })
+
+    assert response.status_code == 201
+    user = User.query.filter_by(email='nulls@example.com').one()
+    assert user.first_name == ''
+    assert user.last_name == ''
+
+
+@pytest.mark.parametrize('email', [42, ['a@example.com'], {'a': 1}])
+def test_login_rejects_non_string_email(client, email):
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'secret'})
+
+    assert response.status_code == 400
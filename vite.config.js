@@ -12,6 +12,7 @@ export default defineConfig({
       '/api': {
         target: 'http://127.0.0.1:5000',
         changeOrigin: true,
+        xfwd: true,
         secure: false,
         rewrite: (path) => path,
         configure: (proxy, _options) => {